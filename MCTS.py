@@ -9,7 +9,12 @@ you can take a look at game1.py to get a sense of how the game is structured.
 # These imports are used by the starter code.
 import random
 import argparse
+import json
+import multiprocessing
+import time
+import numpy as np
 import game1
+import rolloutPolicies
 from math import sqrt, log, isnan
 # random.seed(1)
 # You will want to use this import in your code
@@ -22,32 +27,173 @@ DISPLAY_BOARDS = False
 global UCB_CONST
 UCB_CONST = .5
 
+# Whether MCTS shares nodes between transpositions (the same position reached
+# by different move orders), turning the tree into a DAG.
+TRANSPOSITIONS = False
+
+# Whether the transposition table also shares nodes between a position and its
+# left-right mirror image, by keying it on canonical state keys.
+SYMMETRY = False
+
+# Number of worker processes for root-parallel MCTS. With more than one, each
+# worker grows its own tree from the root and their root statistics are merged.
+WORKERS = 1
+_pool = None # created on first use
+
+# Whether the workers share one tree instead: the main process descends it once
+# per worker, marking each path with a virtual loss so the descents spread out,
+# and the workers run the rollouts from the selected leaves in parallel.
+TREE_PARALLEL = False
+VIRTUAL_LOSS = 1 # number of lost visits a pending rollout adds to its path
+
+# Number of leaves MCTS selects per round and plays out together with
+# game1.rolloutBatch. 1 plays each rollout on its own with simulate. The batch
+# has per-step array overheads, so on the default board it only beats serial
+# bitboard rollouts from about 64 leaves up.
+BATCH_SIZE = 1
+
+# Per-move time budget in milliseconds. If non-0, MCTS runs rollouts until the
+# budget is spent instead of running a fixed number, reading the clock once
+# every CLOCK_CHECK_INTERVAL rollouts.
+TIME_MS = 0
+CLOCK_CHECK_INTERVAL = 16
+
+# Whether MCTS keeps its tree in a NodePool (compact arrays, argmax UCT
+# selection) instead of Node objects. Only the plain serial search is
+# available with it, and each move is searched from an empty pool, so no
+# rollouts carry over between moves.
+ARRAY_NODES = False
+
+# How select picks among fully expanded children: "sample" picks a child with
+# probability proportional to its UCB weight, "uct" picks the child with the
+# highest UCB score, breaking ties towards the lowest move.
+SELECTION = "sample"
+
+# RAVE (all-moves-as-first) equivalence parameter. If non-0, each rollout also
+# updates AMAF statistics for every child along its path whose move the same
+# player made later in the rollout, and UCB blends the AMAF value into the
+# child's value with weight sqrt(RAVE_EQUIV / (3 * visits + RAVE_EQUIV)).
+# Only serial search collects them, so it cannot be combined with --batchSize
+# or --treeParallel (root-parallel workers each search serially and do).
+RAVE_EQUIV = 0
+
+# Whether MCTS runs as an MCTS-Solver: nodes whose result is decided by terminal
+# positions below them are marked as proven wins or losses (for the player to
+# move there), select no longer samples them, and the search stops as soon as
+# the root is proven.
+SOLVER = False
+PROVEN_WIN = 1
+PROVEN_LOSS = -1
+
+# Whether select expands every child of a node at once (see Node.expandAll)
+# instead of one per rollout. Each new child is then simulated in turn, in
+# random order, before UCB is used to choose between them.
+EXPAND_ALL = False
+
+# Policy choosing the moves of rollouts (see rolloutPolicies), or None for
+# uniformly random moves. Batched rollouts are always uniformly random, so
+# with a policy the leaves of a batch are played out one by one.
+ROLLOUT_POLICY = None
+
+# Opening book (see openingBook) consulted before searching, or None.
+BOOK = None
+
+# Node budget for a search tree, or 0 for no limit. Before a search could grow
+# the tree past MAX_NODES, the least-visited subtrees are collapsed into their
+# roots (which keep their statistics) until the tree is down to
+# EVICTION_TARGET * MAX_NODES nodes.
+MAX_NODES = 0
+EVICTION_TARGET = .75
+
+# Number of Nodes created so far, so that search can keep track of the size of
+# a tree under a budget without walking it.
+NODES_CREATED = 0
+
+# If a list, MCTS appends a dictionary of statistics about every search to it
+# (see searchRecord). While it is collecting, PHASE_TIMES holds the seconds the
+# current search has spent in each phase, charged by lap.
+SEARCH_LOG = None
+PHASES = ("select", "expand", "simulate", "backprop", "evict")
+PHASE_TIMES = None
+_lastLap = 0.
+
+# The module settings a search reads. Worker processes are sent their values
+# with every job (see searchSettings) rather than relying on inheriting them.
+SEARCH_SETTINGS = ("UCB_CONST", "TRANSPOSITIONS", "SYMMETRY", "BATCH_SIZE",
+                   "CLOCK_CHECK_INTERVAL", "SELECTION", "RAVE_EQUIV", "SOLVER",
+                   "EXPAND_ALL", "ROLLOUT_POLICY", "MAX_NODES", "EVICTION_TARGET")
+
+# LOG_TABLE[n] is log(n) (with log(0) taken as 0), extended as needed by logVisits
+# up to LOG_TABLE_LIMIT entries; larger counts are computed directly.
+LOG_TABLE = np.zeros(1)
+LOG_TABLE_LIMIT = 1 << 20
+
 
 class Node(object):
     """Node used in MCTS"""
+
+    __slots__ = ("state", "parent", "children", "visits", "value", "virtualLoss",
+                 "amafVisits", "amafValue", "proven", "table")
     
-    def __init__(self, state, parent_node):
+    def __init__(self, state, parent_node, table=None):
         """Constructor for a new node representing game state
         state. parent_node is the Node that is the parent of this
-        one in the MCTS tree. """
+        one in the MCTS tree. table, if given, maps state keys (see
+        tableKey) to the Nodes already in the search so transpositions can
+        share them. """
         self.state = state
-        self.parent = parent_node
+        self.parent = parent_node # with a table, the first parent to reach this node
         self.children = {} # maps moves (keys) to Nodes (values); if you use it differently, you must also change addMove
         self.visits = 0
         self.value = float("nan")
-        # Note: you may add additional fields if needed
+        self.virtualLoss = 0 # pending tree-parallel rollouts through this node, times VIRTUAL_LOSS
+        self.amafVisits = 0 # rollouts in which this node's move was played later by the same player
+        self.amafValue = 0. # win rate for the player at this node over those rollouts
+        self.proven = 0 # PROVEN_WIN or PROVEN_LOSS for the player to move here, once solved
+        self.table = table
+        if table is not None:
+            table[tableKey(state)] = self
+        global NODES_CREATED
+        NODES_CREATED += 1
+        # Note: you may add additional fields if needed; they must also be added to __slots__
         
     def addMove(self, move):
         """
         Adds a new node for the child resulting from move if one doesn't already exist.
+        If the node has a transposition table and the resulting position is already
+        in it, the existing node becomes the child instead of a new one. With
+        SYMMETRY that node may hold the mirror image of the resulting position.
         Returns true if a new node was added, false otherwise.
         """
         if move not in self.children:
             state = self.state.nextState(move)
-            self.children[move] = Node(state, self)
+            child = None
+            if self.table is not None:
+                child = self.table.get(tableKey(state))
+            if child is None:
+                child = Node(state, self, self.table)
+            self.children[move] = child
             return True
         return False
     
+    def expandAll(self):
+        """
+        Adds nodes for all the children that don't exist yet, using
+        game1.childStates to find the ones that end the game with a win in
+        one pass. With SOLVER those are marked proven straight away.
+        """
+        for move, state in game1.childStates(self.state):
+            if move in self.children:
+                continue
+            child = None
+            if self.table is not None:
+                child = self.table.get(tableKey(state))
+            if child is None:
+                child = Node(state, self, self.table)
+            self.children[move] = child
+            if SOLVER:
+                updateProof(child)
+
     def getValue(self):
         """
         Gets the value estimate for the current node. Value estimates should correspond
@@ -78,18 +224,171 @@ class Node(object):
         self.visits += 1
         self.value = nextTotal/self.visits
 
-    def UCBWeight(self):
+    def updateAmaf(self, outcome):
+        """Updates the AMAF value estimate for the node's state, in the same way
+        updateValue updates its value estimate."""
+        if outcome == 0:
+            reward = 0.5
+        elif outcome == self.state.getTurn():
+            reward = 1.
+        else:
+            reward = 0.
+        self.amafVisits += 1
+        self.amafValue += (reward - self.amafValue) / self.amafVisits
+
+    def UCBWeight(self, parentVisits=None):
         """Weight from the UCB formula used by parent to select a child.
         This node will be selected by parent with probability proportional
-        to its weight."""
+        to its weight. parentVisits is the visit count of the parent doing the
+        selecting; it defaults to self.parent's, but a node shared between
+        transpositions can be selected by any of its parents."""
         "*** YOUR CODE HERE ***"
         global UCB_CONST
+        if parentVisits is None:
+            parentVisits = self.parent.visits + self.parent.virtualLoss
+        visits = self.visits + self.virtualLoss
+        value = self.getValue()
+        if RAVE_EQUIV and self.amafVisits:
+            beta = sqrt(RAVE_EQUIV / (3. * self.visits + RAVE_EQUIV))
+            value = (1 - beta) * value + beta * self.amafValue
+        if self.virtualLoss:
+            # pending rollouts count as wins for this node's player, i.e. losses for
+            # the parent choosing it, so that other descents prefer other children
+            total = value * self.visits if self.visits else 0.
+            value = (total + self.virtualLoss) / visits
         # for the node choosing the child; the value of the node should be the lose rate (which is what the
         # parent node want to maximize
-        weight = 1 - self.getValue() + UCB_CONST * sqrt(log(self.parent.visits)/self.visits)
+        weight = 1 - value + UCB_CONST * sqrt(log(parentVisits)/visits)
         return weight
 
-def MCTS(root, rollouts):
+def tableKey(state):
+    """
+    The key state is stored under in a transposition table: its canonical key
+    with SYMMETRY, so that mirror images share a node, and its key otherwise.
+    """
+    if SYMMETRY:
+        return state.getCanonicalKey()
+    return state.getKey()
+
+class NodePool(object):
+    """
+    Struct-of-arrays storage for an MCTS tree. The statistics of node i live at
+    index i of each array, with node 0 the root. All the children of a node are
+    allocated together when it is first expanded, at the consecutive indices
+    firstChild[i] to firstChild[i] + numChildren[i] - 1, so UCB scores for all
+    of them are one vectorized computation over a slice. Children are allocated
+    in random order and tried in allocation order, so the first numTried[i] of
+    them are the ones already in the search. States are not stored; each
+    descent replays the moves from the root state.
+    """
+
+    __slots__ = ("size", "visits", "values", "parent", "firstChild", "numChildren",
+                 "numTried", "move")
+
+    def __init__(self, capacity=1024):
+        self.size = 1
+        self.visits = np.zeros(capacity, np.int32)
+        self.values = np.zeros(capacity) # win rate for the player to move at the node
+        self.parent = np.full(capacity, -1, np.int32)
+        self.firstChild = np.full(capacity, -1, np.int32) # -1 until the node is expanded
+        self.numChildren = np.zeros(capacity, np.int8)
+        self.numTried = np.zeros(capacity, np.int8)
+        self.move = np.zeros(capacity, np.int8) # move from the parent leading to the node
+
+    def expand(self, node, moves):
+        """
+        Allocates one child of node for each of moves, in random order.
+        Returns the index of the first child.
+        """
+        moves = list(moves)
+        random.shuffle(moves)
+        first = self.size
+        self.size += len(moves)
+        if self.size > len(self.visits):
+            self._grow(2 * self.size)
+        self.parent[first:self.size] = node
+        self.move[first:self.size] = moves
+        self.firstChild[node] = first
+        self.numChildren[node] = len(moves)
+        return first
+
+    def update(self, node, outcome, turn):
+        """
+        Updates the value estimate of node, whose player to move is turn, with
+        the outcome of a simulation (as in Node.updateValue).
+        """
+        if outcome == 0:
+            reward = 0.5
+        elif outcome == turn:
+            reward = 1.
+        else:
+            reward = 0.
+        visits = self.visits[node] + 1
+        self.values[node] += (reward - self.values[node]) / visits
+        self.visits[node] = visits
+
+    def _grow(self, capacity):
+        """
+        Reallocates every array with room for capacity nodes.
+        """
+        for name, fill in (("visits", 0), ("values", 0), ("parent", -1), ("firstChild", -1),
+                           ("numChildren", 0), ("numTried", 0), ("move", 0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+def arrayMCTS(state, rollouts, deadline=None):
+    """
+    MCTS from state on a fresh NodePool, running the given number of rollouts
+    or, if a deadline (a time.time() value) is given, running them until it
+    passes. Every child of a node is tried once, in random order, before the
+    child with the highest UCB score is chosen. The pool is thrown away
+    afterwards, so the next move's search does not reuse any of it.
+    Returns the move to the root child with the lowest value and the number of
+    rollouts run.
+    """
+    pool = NodePool()
+    done = 0
+    while (deadline is None and done < rollouts) or \
+            (deadline is not None and (done == 0 or time.time() < deadline)):
+        for i in range(CLOCK_CHECK_INTERVAL if deadline is not None else 1):
+            arrayRollout(pool, state)
+        done += CLOCK_CHECK_INTERVAL if deadline is not None else 1
+
+    first = pool.firstChild[0]
+    children = slice(first, first + pool.numTried[0])
+    return int(pool.move[first + pool.values[children].argmin()]), done
+
+def arrayRollout(pool, rootState):
+    """
+    One select/expand/simulate/backpropagate round of arrayMCTS.
+    """
+    node = 0
+    state = rootState
+    path = [(node, state.getTurn())]
+    while not state.isTerminal():
+        first = pool.firstChild[node]
+        if first < 0:
+            first = pool.expand(node, state.getMoves())
+        tried = pool.numTried[node]
+        if tried < pool.numChildren[node]:
+            # expand the next untried child and simulate from it
+            pool.numTried[node] = tried + 1
+            node = first + tried
+            state = state.nextState(int(pool.move[node]))
+            path.append((node, state.getTurn()))
+            break
+        children = slice(first, first + tried)
+        scores = uctScores(pool.values[children], pool.visits[children], pool.visits[node])
+        node = first + scores.argmax()
+        state = state.nextState(int(pool.move[node]))
+        path.append((node, state.getTurn()))
+    outcome = simulateState(state)
+    for node, turn in path:
+        pool.update(node, outcome, turn)
+
+def MCTS(root, rollouts, stats=None):
     """Select a move by Monte Carlo tree search.
     Plays rollouts random games from the root node to a terminal state.
     In each rollout, play proceeds according to UCB while all children have
@@ -98,73 +397,622 @@ def MCTS(root, rollouts):
     Upon reaching a terminal state, values are propagated back along the
     expanded portion of the path. After all rollouts are completed, the move
     generating the highest value child of root is returned.
+    Positions in the opening BOOK, if there is one, are not searched.
+    If TIME_MS is set, rollouts is ignored and rollouts are run until
+    TIME_MS milliseconds have passed; the best move found by then is returned.
     Inputs:
         node: the node for which we want to find the optimal move
         rollouts: the number of root-leaf traversals to run
+        stats: if a dictionary, the rollouts run and the seconds spent are
+            added to its "rollouts" and "searchTime" entries, and the nodes
+            evicted to stay within MAX_NODES to its "evictedNodes" entry
     Return:
         The legal move from node.state with the highest value estimate
     """
     "*** YOUR CODE HERE ***"
-    if rollouts == 0:
+    if rollouts == 0 and TIME_MS == 0:
         return randomMove(root)
+    if BOOK is not None:
+        move = BOOK.lookup(root.state)
+        if move is not None:
+            return move
+    if SOLVER and root.proven == PROVEN_WIN:
+        return solvedMove(root)
+    global PHASE_TIMES, _lastLap
+    start = time.time()
+    deadline = start + TIME_MS / 1000. if TIME_MS else None
+    if SEARCH_LOG is not None:
+        PHASE_TIMES = dict.fromkeys(PHASES, 0.)
+        _lastLap = start
+    if ARRAY_NODES:
+        nextMove, done = arrayMCTS(root.state, rollouts, deadline)
+    elif WORKERS > 1 and not TREE_PARALLEL:
+        nextMove, done = rootParallelMCTS(root, rollouts, deadline, stats)
+    else:
+        done = search(root, rollouts, deadline, stats)
+        nextMove = bestMove(root)
+    seconds = time.time() - start
+    _addSearchStats(stats, done, seconds)
+    if DISPLAY_BOARDS:
+        print game1.show_values(root)
+    if SEARCH_LOG is not None:
+        SEARCH_LOG.append(searchRecord(root, nextMove, done, seconds))
+        PHASE_TIMES = None
+    return nextMove
+
+def bestMove(root):
+    """
+    Returns the move to the child of a searched root with the lowest value,
+    or a winning move if the root is proven to be won.
+    """
+    if root.proven == PROVEN_WIN:
+        return solvedMove(root)
+
+    # find the child node with lowest value(least likely to win for the opponent),
+    # avoiding children proven to be wins for the opponent
+    nextMove = None
+    for move, child in root.children.items():
+        best = root.children.get(nextMove)
+        if (nextMove is None) or \
+                (child.proven, child.getValue()) < (best.proven, best.getValue()):
+            nextMove = move
+    return nextMove
+
+def solvedMove(root):
+    """
+    Returns a move from a root proven to be a win into a child proven to be
+    a loss for the opponent.
+    """
+    for move, child in root.children.items():
+        if child.proven == PROVEN_LOSS:
+            return move
+
+def lap(phase):
+    """
+    Charges the time since the previous lap to phase in PHASE_TIMES, if the
+    phases of the search are being timed.
+    """
+    global _lastLap
+    if PHASE_TIMES is not None:
+        now = time.time()
+        PHASE_TIMES[phase] += now - _lastLap
+        _lastLap = now
+
+def searchRecord(root, move, rollouts, seconds):
+    """
+    Returns a dictionary of statistics about a search from root that ran
+    rollouts rollouts in seconds and chose move: the rollout rate, the size of
+    the tree under root and the maximum and mean depth of its nodes, the time
+    spent in each phase (see PHASES), the root's visits and value, and the
+    principal variation. Root-parallel and array searches do not grow the tree
+    under root, and only time their phases in total.
+    """
+    plies = sum(root.state.getHeights())
+    depths = [sum(node.state.getHeights()) - plies for node in treeNodes(root)]
+    return {"ply": plies,
+            "turn": root.state.getTurn(),
+            "move": int(move),
+            "rollouts": rollouts,
+            "seconds": seconds,
+            "rolloutsPerSecond": rollouts / seconds if seconds > 0 else None,
+            "treeSize": len(depths),
+            "maxDepth": max(depths),
+            "avgDepth": float(sum(depths)) / len(depths),
+            "phaseSeconds": dict(PHASE_TIMES),
+            "rootVisits": root.visits,
+            "rootValue": None if isnan(root.value) else root.value,
+            "principalVariation": principalVariation(root)}
+
+def principalVariation(root):
+    """
+    Returns the moves found by following the most visited child from root
+    until reaching a node without children.
+    """
+    moves = []
+    node = root
+    while node.children:
+        move, node = max(node.children.items(), key=lambda item: item[1].visits)
+        moves.append(int(move))
+    return moves
+
+def writeSearchLog(statsFile, extra):
+    """
+    Writes the records in SEARCH_LOG to statsFile as JSON lines, adding the
+    entries of the dictionary extra to each, and empties the log.
+    """
+    for record in SEARCH_LOG:
+        record.update(extra)
+        statsFile.write(json.dumps(record, sort_keys=True) + "\n")
+    statsFile.flush()
+    del SEARCH_LOG[:]
+
+def _addSearchStats(stats, rollouts, seconds):
+    """
+    Adds the rollouts and time of one search to stats, if it is a dictionary.
+    """
+    if stats is not None:
+        stats["rollouts"] = stats.get("rollouts", 0) + rollouts
+        stats["searchTime"] = stats.get("searchTime", 0.) + seconds
+
+def search(root, rollouts, deadline=None, stats=None):
+    """
+    Grows the tree under root with the given number of rollouts or, if a
+    deadline (a time.time() value) is given, until the deadline has passed,
+    looking at the clock only once per chunk of rollouts. At least one chunk
+    is always run. With MAX_NODES, rollouts are also run in chunks small
+    enough that the tree cannot outgrow the budget, making room with
+    makeRoom between them. Returns the number of rollouts run.
+    """
+    batched = WORKERS > 1 or BATCH_SIZE > 1
+    chunk = CLOCK_CHECK_INTERVAL
+    if batched:
+        chunk = max(chunk, BATCH_SIZE * (WORKERS if TREE_PARALLEL else 1))
+    room = 0 # rollouts that can run before the tree might exceed MAX_NODES
+    if MAX_NODES:
+        # counted once, then kept up to date from the nodes created since
+        size = len(treeNodes(root))
+        created = NODES_CREATED
+    done = 0
+    while not root.proven and ((deadline is None and done < rollouts) or
+                               (deadline is not None and (done == 0 or time.time() < deadline))):
+        count = rollouts - done if deadline is None else chunk
+        if MAX_NODES:
+            if room <= 0:
+                size += NODES_CREATED - created
+                created = NODES_CREATED
+                room, size = makeRoom(root, size, stats)
+                lap("evict")
+            count = min(count, room)
+        if batched:
+            count = runBatchedRollouts(root, count)
+        else:
+            count = runRollouts(root, count)
+        done += count
+        room -= count
+    return done
+
+def makeRoom(root, size, stats=None):
+    """
+    Collapses subtrees under root (see evictNodes) if its size, the number
+    of nodes in it, is more than EVICTION_TARGET * MAX_NODES, adding the
+    number of nodes removed to stats["evictedNodes"] if stats is a
+    dictionary. Returns the number of rollouts that can then run before the
+    tree might exceed MAX_NODES, as each rollout adds at most one node (or
+    one node's children, with EXPAND_ALL), and the new size.
+    """
+    target = int(EVICTION_TARGET * MAX_NODES)
+    if size > target:
+        evicted = evictNodes(root, target)
+        size -= evicted
+        if stats is not None:
+            stats["evictedNodes"] = stats.get("evictedNodes", 0) + evicted
+    nodesPerRollout = root.state.geometry.width if EXPAND_ALL else 1
+    # always allow a rollout, even with a budget too small for the root's children
+    return max((MAX_NODES - size) // nodesPerRollout, 1), size
+
+def evictNodes(root, target):
+    """
+    Collapses the least-visited subtrees under root until about target nodes
+    are left. A collapsed node keeps its visits and value, which already sum
+    up every rollout through it, but loses its children; select expands it
+    again from scratch if it gets there. With transpositions a node is only
+    removed once no node left in the tree leads to it, and the transposition
+    table is cut down to the nodes still in the tree. Returns the number of
+    nodes removed.
+    """
+    nodes = treeNodes(root)
+    # the number of links to each node from the nodes in the tree
+    parents = dict((id(node), 0) for node in nodes)
+    for node in nodes:
+        for child in node.children.values():
+            parents[id(child)] += 1
+    excess = len(nodes) - target
+    removed = 0
+    for node in sorted(nodes[1:], key=lambda node: node.visits):
+        if removed >= excess:
+            break
+        if not node.children or parents[id(node)] == 0:
+            continue
+        below = [(node, child) for child in node.children.values()]
+        node.children = {}
+        while below:
+            parent, descendant = below.pop()
+            parents[id(descendant)] -= 1
+            if descendant.parent is parent:
+                # pruneTable finds it another parent if it stays in the tree
+                descendant.parent = None
+            if parents[id(descendant)] == 0:
+                # nothing left in the tree leads here
+                removed += 1
+                below.extend((descendant, child) for child in descendant.children.values())
+    if root.table is not None:
+        pruneTable(root)
+    return removed
+
+def treeNodes(root):
+    """
+    Returns every node reachable from root, once each, in breadth-first order.
+    """
+    nodes = [root]
+    seen = set([id(root)])
+    for node in nodes:
+        for child in node.children.values():
+            if id(child) not in seen:
+                seen.add(id(child))
+                nodes.append(child)
+    return nodes
+
+def pruneTable(root):
+    """
+    Cuts root's transposition table down to the nodes reachable from root.
+    A reachable node whose parent is not (a transposition first reached
+    through a dropped part of the tree) gets one of its reachable parents
+    instead, so that nothing kept refers to the dropped nodes.
+    """
+    nodes = treeNodes(root)
+    reachable = set(id(node) for node in nodes)
+    root.table.clear()
+    for node in nodes:
+        root.table.setdefault(tableKey(node.state), node)
+        for child in node.children.values():
+            if id(child.parent) not in reachable:
+                child.parent = node
+
+def runRollouts(root, rollouts):
+    """
+    Grow the tree under root by the given number of select/simulate/backPropagate
+    rounds, stopping early if the root gets solved. Returns the number of rounds run.
+    """
     for i in range(rollouts):
+        if root.proven:
+            return i
+        # in a DAG a node has several parents, so remember the path actually taken
+        path = [] if root.table is not None or RAVE_EQUIV or SOLVER else None
         # select & expand
-        toSimulate = select(root)
+        toSimulate = select(root, path)
+        lap("select")
         # simulate and get the outcome
-        outcome = simulate(toSimulate)
+        moves = [] if RAVE_EQUIV else None
+        if toSimulate.proven:
+            outcome = provenOutcome(toSimulate)
+        else:
+            outcome = simulate(toSimulate, moves)
+        lap("simulate")
         # back-propagate
-        backPropagate(toSimulate, outcome)
+        backPropagate(toSimulate, outcome, path)
+        if RAVE_EQUIV and not toSimulate.proven:
+            updateAmafStats(path, moves, outcome)
+        lap("backprop")
+    return rollouts
+
+def runBatchedRollouts(root, rollouts):
+    """
+    Version of runRollouts that selects several leaves per round and scores
+    them together. Each round selects BATCH_SIZE leaves (times WORKERS when the
+    workers share the tree), adding a virtual loss to every node on the way down
+    so that later descents in the round are steered towards other children.
+    The leaves are scored with scoreLeaves, and each outcome is backpropagated
+    along its path as the virtual losses are removed.
+    """
+    leavesPerRound = BATCH_SIZE
+    if WORKERS > 1 and TREE_PARALLEL:
+        leavesPerRound *= WORKERS
+    done = 0
+    while done < rollouts and not root.proven:
+        paths = []
+        for i in range(min(leavesPerRound, rollouts - done)):
+            path = []
+            select(root, path)
+            for node in path:
+                node.virtualLoss += VIRTUAL_LOSS
+            paths.append(path)
+        lap("select")
+        outcomes = scoreLeaves([path[-1].state for path in paths])
+        lap("simulate")
+        for path, outcome in zip(paths, outcomes):
+            for node in path:
+                node.virtualLoss -= VIRTUAL_LOSS
+            if path[-1].proven:
+                outcome = provenOutcome(path[-1])
+            backPropagate(path[-1], outcome, path)
+        lap("backprop")
+        done += len(paths)
+    return done
+
+def scoreLeaves(states):
+    """
+    Returns the outcome of one random playout from each of the given states.
+    With a shared tree the states are split into one chunk per worker and the
+    chunks are played in the process pool; otherwise they are played here.
+    """
+    if WORKERS > 1 and TREE_PARALLEL:
+        size = -(-len(states) // WORKERS)
+        settings = searchSettings()
+        jobs = [(states[i:i + size], batchedScoring(), settings, random.getrandbits(32))
+                for i in range(0, len(states), size)]
+        outcomes = []
+        for chunk in getPool().map(_scoreChunk, jobs, 1):
+            outcomes.extend(chunk)
+        return outcomes
+    return _scoreChunk((states, batchedScoring(), None, random.getrandbits(32)))
+
+def batchedScoring():
+    """
+    Whether leaves are played out together with game1.rolloutBatch, which
+    only plays uniformly random games.
+    """
+    return BATCH_SIZE > 1 and ROLLOUT_POLICY is None
+
+def _scoreChunk(job):
+    """
+    Plays one random game from each state with the given seed, all at once
+    with game1.rolloutBatch if batched is set, and returns their outcomes.
+    Also the worker process side of scoreLeaves, which sends the search
+    settings to use (see searchSettings); they are None in this process.
+    """
+    states, batched, settings, seed = job
+    if settings is not None:
+        applySearchSettings(settings)
+    if batched:
+        return list(game1.rolloutBatch(states, np.random.RandomState(seed)))
+    random.seed(seed)
+    return [simulateState(state) for state in states]
+
+def rootParallelMCTS(root, rollouts, deadline=None, stats=None):
+    """
+    Root-parallel MCTS: splits the rollouts between WORKERS processes, each of
+    which searches its own fresh tree from root.state (until the deadline, if
+    one is given). The visits and values of the root's children are then merged
+    across workers (values weighted by visits). The tree under root itself is
+    not grown, so nothing carries over to the next move's search: advanceRoot
+    reports no reused rollouts in this mode. Nodes the workers evict are added
+    to stats as in search.
+    Returns the move with the lowest merged value and the total number of
+    rollouts run.
+    """
+    jobs = []
+    for i in range(WORKERS):
+        share = rollouts // WORKERS + (1 if i < rollouts % WORKERS else 0)
+        if share > 0 or deadline is not None:
+            # seed each worker from our generator so runs stay reproducible
+            jobs.append((root.state, share, deadline, searchSettings(), random.getrandbits(32)))
 
-    # find the child node with lowest value(least likely to win for the opponent)
+    visits = {}
+    totals = {}
+    done = 0
+    for childStats, workerRollouts, evicted in getPool().map(_searchFromRoot, jobs):
+        done += workerRollouts
+        if stats is not None and evicted:
+            stats["evictedNodes"] = stats.get("evictedNodes", 0) + evicted
+        for move, (childVisits, childValue) in childStats.items():
+            visits[move] = visits.get(move, 0) + childVisits
+            totals[move] = totals.get(move, 0.) + childVisits * childValue
+
+    # find the move with lowest merged value (least likely to win for the opponent)
     nextMove = None
-    for move, child in root.children.items():
-        if (nextMove is None) or (child.getValue() < root.children[nextMove].getValue()):
+    for move in visits:
+        value = totals[move] / visits[move]
+        if (nextMove is None) or (value < bestValue):
             nextMove = move
-    return nextMove
+            bestValue = value
+    return nextMove, done
+
+def _searchFromRoot(job):
+    """
+    Worker process side of rootParallelMCTS. Runs the search, with the
+    settings sent in the job, on a new tree and returns a dictionary mapping
+    each root move to (visits, value), along with the number of rollouts run
+    and the number of nodes evicted.
+    """
+    state, rollouts, deadline, settings, seed = job
+    applySearchSettings(settings)
+    global WORKERS
+    WORKERS = 1 # this worker's own tree is searched serially
+    random.seed(seed)
+    root = Node(state, None, {} if TRANSPOSITIONS or SYMMETRY else None)
+    stats = {}
+    done = search(root, rollouts, deadline, stats)
+    return (dict((move, (child.visits, child.value))
+                 for move, child in root.children.items() if child.visits > 0), done,
+            stats.get("evictedNodes", 0))
+
+def searchSettings():
+    """
+    Returns a dictionary of the current values of the SEARCH_SETTINGS, to be
+    sent to a worker process.
+    """
+    return dict((name, globals()[name]) for name in SEARCH_SETTINGS)
+
+def applySearchSettings(settings):
+    """
+    Makes the settings from searchSettings the current ones in this process.
+    """
+    globals().update(settings)
+
+def getPool():
+    """
+    Returns the process pool used for parallel MCTS, creating it with
+    WORKERS processes the first time it is needed.
+    """
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(WORKERS)
+    return _pool
 
-def backPropagate(currentNode, outcome):
+def closePool():
+    """
+    Shuts down the process pool if one was created.
+    """
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+
+def backPropagate(currentNode, outcome, path=None):
+    """
+    Update the nodes above currentNode with the outcome of a simulation.
+    If path (the nodes from the root down to currentNode, as filled in by
+    select) is given, exactly those nodes are updated; this is needed when
+    transpositions are shared, since parent pointers then only record one of
+    a node's parents. Otherwise the parent pointers are followed to the root.
+    """
+    if path is not None:
+        for node in path:
+            node.updateValue(outcome)
+        if SOLVER:
+            for node in reversed(path):
+                if not updateProof(node):
+                    break
+        return
     while currentNode is not None:
         # updateValue() also updates count
         currentNode.updateValue(outcome)
         currentNode = currentNode.parent
 
-def simulate(node):
+def updateProof(node):
+    """
+    MCTS-Solver step: marks node as proven if it is a won terminal position
+    (a loss for the player to move), if one of its children is a proven loss
+    (so moving there wins), or if every legal move has been expanded and all
+    of the children are proven wins for the opponent.
+    Returns True if node is proven.
+    """
+    if node.proven:
+        return True
+    if node.state.isTerminal():
+        if node.state.value() != 0:
+            node.proven = PROVEN_LOSS
+    else:
+        children = node.children.values()
+        if any(child.proven == PROVEN_LOSS for child in children):
+            node.proven = PROVEN_WIN
+        elif len(children) == len(node.state.getMoves()) and \
+                all(child.proven == PROVEN_WIN for child in children):
+            node.proven = PROVEN_LOSS
+    return node.proven != 0
+
+def provenOutcome(node):
+    """
+    The outcome of the game (as in State.value()) from a proven node.
+    """
+    return node.proven * node.state.getTurn()
+
+def simulate(node, played=None):
     """
     Simulate a random game from a node.
     :param node: node to simulate
+    :param played: if not None, the moves of the game are appended to it
+    :return: the outcome of the simulation
+    """
+    return simulateState(node.state, played)
+
+def simulateState(currentState, played=None):
+    """
+    Simulate a random game from a state.
+    :param currentState: state to simulate
+    :param played: if not None, the moves of the game are appended to it
     :return: the outcome of the simulation
     """
-    currentState = node.state
     while not currentState.isTerminal():
-        moves = currentState.getMoves()
-        nextInd = random.randint(0, len(moves)-1)
-        currentState = currentState.nextState(moves[nextInd])
+        if ROLLOUT_POLICY is not None:
+            move = ROLLOUT_POLICY.getMove(currentState)
+        else:
+            moves = currentState.getMoves()
+            move = moves[random.randint(0, len(moves)-1)]
+        if played is not None:
+            played.append(move)
+        currentState = currentState.nextState(move)
     return currentState.value()
 
-def select(currentNode):
+def updateAmafStats(path, played, outcome):
+    """
+    RAVE update after a rollout. path is the list of nodes select went
+    through and played the moves of the random game after it. For each node
+    on the path, every child whose move the node's player went on to make
+    (the first time it made it) has its AMAF statistics updated. With
+    SYMMETRY a node on the path can hold the mirror image of the position
+    reached, so moves are compared in the orientation of the first node.
+    """
+    # the moves made from each node of the path onwards: tree moves, then the
+    # random game, with whether each node is mirrored relative to path[0]
+    moves = []
+    flips = [False]
+    for node, nextNode in zip(path, path[1:]):
+        for move, child in node.children.items():
+            if child is nextNode:
+                moves.append(mirrorMove(node.state, move, flips[-1]))
+                flips.append(flips[-1] != isMirroredChild(node, move, child))
+                break
+    moves.extend(mirrorMove(path[-1].state, move, flips[-1]) for move in played)
+    for i, node in enumerate(path):
+        seen = set()
+        # moves i, i+2, ... are made by the player to move at node
+        for move in moves[i::2]:
+            if move in seen:
+                continue
+            seen.add(move)
+            child = node.children.get(mirrorMove(node.state, move, flips[i]))
+            if child is not None:
+                child.updateAmaf(outcome)
+
+def select(currentNode, path=None):
     """
     Recursive function to select and expand an unexpanded node in the tree.
     If a terminal node is encountered, it returns it.
     :param currentNode:
+    :param path: if not None, every node visited is appended to it
     :return: the node to simulate for the next step in MCTS.
     """
-    # Base case 1: check terminal state
-    if currentNode.state.isTerminal():
+    if path is not None:
+        path.append(currentNode)
+    # Base case 1: check terminal state (or one already solved)
+    if currentNode.state.isTerminal() or currentNode.proven:
+        return currentNode
+    if EXPAND_ALL:
+        # Base case 2: a node with unexpanded children has them all added at
+        # once, and each child is returned for simulation once, in random order
+        if len(currentNode.children) < len(currentNode.state.getMoves()):
+            lap("select")
+            currentNode.expandAll()
+            lap("expand")
+            if SOLVER and updateProof(currentNode):
+                return currentNode
+        child = getUnvisitedChild(currentNode)
+        if child is not None:
+            if path is not None:
+                path.append(child)
+            return child
+    else:
+        nextMove = getUnexpandedMove(currentNode)
+        # Base case 2: has unexpanded child, expand and return the child for simulation
+        if nextMove is not None:
+            # find an unexpanded node, add it to the search tree
+            lap("select")
+            currentNode.addMove(nextMove)
+            lap("expand")
+            child = currentNode.children[nextMove]
+            if path is not None:
+                path.append(child)
+            return child
+
+    # Base case 3: every child is solved, so this node is too
+    if SOLVER and updateProof(currentNode):
         return currentNode
-    nextMove = getUnexpandedMove(currentNode)
-    # Base case 2: has unexpanded child, expand and return the child for simulation
-    if nextMove is not None:
-        # find an unexpanded node, add it to the search tree
-        currentNode.addMove(nextMove)
-        return currentNode.children[nextMove]
+
+    if SELECTION == "uct":
+        return select(uctChild(currentNode), path)
 
     # node without unexpanded child, pick one child w.p. proportional to weight
     zConstant = 0.
     nodes = []
     weights = []
     for key, node in currentNode.children.items():
+        if node.proven:
+            # a solved child is not worth sampling again
+            continue
         nodes.append(node)
-        weight = node.UCBWeight()
+        weight = node.UCBWeight(currentNode.visits + currentNode.virtualLoss)
         weights.append(weight)
         zConstant += weight
 
@@ -174,9 +1022,50 @@ def select(currentNode):
     for i, weight in enumerate(weights):
         cumWeightSum += weight
         if randomNumber <= cumWeightSum:
-            return select(nodes[i])
+            return select(nodes[i], path)
     assert False, "should not get here"
 
+def uctChild(node):
+    """
+    Returns the child of a fully expanded node with the highest UCB score
+    (see Node.UCBWeight), or an unvisited child if there is one. Children
+    are considered in order of their moves, so ties go to the lowest move.
+    """
+    parentVisits = node.visits + node.virtualLoss
+    best = None
+    for move in sorted(node.children):
+        child = node.children[move]
+        if child.proven:
+            continue
+        if child.visits + child.virtualLoss == 0:
+            return child
+        score = child.UCBWeight(parentVisits)
+        if best is None or score > bestScore:
+            best = child
+            bestScore = score
+    return best
+
+def uctScores(values, visits, parentVisits):
+    """
+    UCB scores, from the parent's point of view, of children with the given
+    arrays of values (win rates for the player to move at each child) and
+    visits. Used by the NodePool search, whose statistics are already arrays.
+    """
+    return 1 - values + UCB_CONST * np.sqrt(logVisits(parentVisits) / visits)
+
+def logVisits(visits):
+    """
+    Returns log(visits) from LOG_TABLE, growing the table if needed.
+    """
+    global LOG_TABLE
+    if visits >= len(LOG_TABLE):
+        if visits >= LOG_TABLE_LIMIT:
+            return log(visits)
+        size = min(2 * visits + 1, LOG_TABLE_LIMIT)
+        LOG_TABLE = np.zeros(size)
+        LOG_TABLE[1:] = np.log(np.arange(1, size))
+    return LOG_TABLE[visits]
+
 def getUnexpandedMove(node):
     """
     Pick an unexpanded move at random for a node.
@@ -195,6 +1084,17 @@ def getUnexpandedMove(node):
     # randomly choose a child
     return candidates[random.randint(0, len(candidates)-1)]
 
+def getUnvisitedChild(node):
+    """
+    Picks a child of node at random from those with no visits and no pending
+    rollouts. If there are none, returns None.
+    """
+    candidates = [child for child in node.children.values()
+                  if child.visits == 0 and child.virtualLoss == 0]
+    if not candidates:
+        return None
+    return candidates[random.randint(0, len(candidates)-1)]
+
 
 def parse_args():
     """
@@ -214,11 +1114,133 @@ def parse_args():
                     "argument. Default=0 (other player is random)")   
     p.add_argument("--ucbConst", type=float, default=.5, help="Value for the UCB exploration"+\
                     "constant. Default=.5") 
+    p.add_argument("--transpositions", action="store_true", help="Set this flag to "+\
+                    "share MCTS nodes between positions reached by different move orders.")
+    p.add_argument("--symmetry", action="store_true", help="Set this flag to "+\
+                    "share MCTS nodes between positions and their left-right mirror images "+\
+                    "(this also shares transpositions).")
+    p.add_argument("--workers", type=int, default=1, help="Number of processes "+\
+                    "for root-parallel MCTS; each searches its own tree with a share of the "+\
+                    "rollouts and the root statistics are merged (so no rollouts carry over "+\
+                    "between moves). Default=1")
+    p.add_argument("--treeParallel", action="store_true", help="Set this flag to "+\
+                    "make the --workers share one tree, using virtual loss to spread their "+\
+                    "rollouts over it, instead of each growing its own.")
+    p.add_argument("--batchSize", type=int, default=1, help="Number of leaves "+\
+                    "to select per round and play out together as one vectorized batch. Batches "+\
+                    "smaller than about 64 are slower than serial rollouts. Default=1")
+    p.add_argument("--timeMs", type=int, default=0, help="If non-0, each MCTS "+\
+                    "agent searches for this many milliseconds per move instead of running "+\
+                    "a fixed number of rollouts. Default=0")
+    p.add_argument("--arrayNodes", action="store_true", help="Set this flag to "+\
+                    "store the MCTS tree in compact arrays and select children by argmax UCB. "+\
+                    "Each move is searched from an empty tree, and it cannot be combined with "+\
+                    "--workers, --treeParallel, --batchSize, --transpositions, --symmetry, "+\
+                    "--solver, --rave, --expandAll or --maxNodes.")
+    p.add_argument("--selection", choices=["sample", "uct"], default="sample", help="How "+\
+                    "MCTS picks among expanded children: 'sample' draws one with probability "+\
+                    "proportional to its UCB weight, 'uct' takes the highest UCB score. Default=sample")
+    p.add_argument("--rave", type=float, default=0, help="If non-0, the RAVE "+\
+                    "equivalence parameter: MCTS then keeps all-moves-as-first statistics and "+\
+                    "blends them into UCB. It cannot be combined with --batchSize or --treeParallel. "+\
+                    "Default=0 (off)")
+    p.add_argument("--solver", action="store_true", help="Set this flag to "+\
+                    "prove wins and losses from terminal positions and stop searching "+\
+                    "solved subtrees.")
+    p.add_argument("--expandAll", action="store_true", help="Set this flag to "+\
+                    "make MCTS add all the children of a node at once, finding immediate wins "+\
+                    "among them in one pass. (--arrayNodes always does this itself.)")
+    p.add_argument("--rolloutPolicy", default="random", help="Policy for rollout "+\
+                    "moves: random, tactical (win or block immediately if possible), center, "+\
+                    "table, or tactical,center / tactical,table. Default=random")
+    p.add_argument("--policyTable", help="File with the cell weights for the "+\
+                    "table rollout policy (see rolloutPolicies.py).")
+    p.add_argument("--learnTable", help="File to save a table for the table rollout "+\
+                    "policy to, learned from --numGames games of MCTS self-play with --rollouts "+\
+                    "rollouts per move for both players (see rolloutPolicies.learnTable).")
+    p.add_argument("--book", help="Opening book file (see openingBook.py) to "+\
+                    "take MCTS moves from when the position is in it.")
+    p.add_argument("--maxNodes", type=int, default=0, help="If non-0, the most "+\
+                    "nodes each MCTS tree may hold; the least-visited subtrees are collapsed "+\
+                    "when it is full. Default=0 (no limit)")
+    p.add_argument("--statsFile", help="File to write statistics about every "+\
+                    "MCTS search to, as JSON lines (see MCTS.searchRecord).")
+    p.add_argument("--bitboard", action="store_true", help="Set this flag to "+\
+                    "use the bitboard representation of the board, which makes rollouts faster.")
+    p.add_argument("--height", type=int, default=game1.HEIGHT, help="Number of rows "+\
+                    "on the board. Default=" + str(game1.HEIGHT))
+    p.add_argument("--width", type=int, default=game1.WIDTH, help="Number of columns "+\
+                    "on the board. Default=" + str(game1.WIDTH))
+    p.add_argument("--connect", type=int, default=game1.CONNECT, help="Number of pieces "+\
+                    "in a row needed to win. Default=" + str(game1.CONNECT))
     args = p.parse_args()
+    try:
+        geometry = game1.getGeometry(args.height, args.width, args.connect)
+    except ValueError as e:
+        p.error(str(e))
+    if args.arrayNodes:
+        # the array search has none of these modes; refuse rather than ignore them
+        for flag, used in (("--workers", args.workers > 1), ("--treeParallel", args.treeParallel),
+                           ("--batchSize", args.batchSize > 1),
+                           ("--transpositions", args.transpositions),
+                           ("--symmetry", args.symmetry), ("--solver", args.solver),
+                           ("--rave", args.rave != 0), ("--expandAll", args.expandAll),
+                           ("--maxNodes", args.maxNodes != 0)):
+            if used:
+                p.error("--arrayNodes cannot be combined with " + flag)
+    if args.rave:
+        # batched rounds do not record the moves their rollouts play
+        for flag, used in (("--batchSize", args.batchSize > 1),
+                           ("--treeParallel", args.treeParallel)):
+            if used:
+                p.error("--rave cannot be combined with " + flag)
+    global DISPLAY_BOARDS
     if args.displayBoard:
         DISPLAY_BOARDS = True
     global UCB_CONST
     UCB_CONST = args.ucbConst
+    global TRANSPOSITIONS
+    TRANSPOSITIONS = args.transpositions
+    global SYMMETRY
+    SYMMETRY = args.symmetry
+    global WORKERS
+    WORKERS = args.workers
+    global TREE_PARALLEL
+    TREE_PARALLEL = args.treeParallel
+    global BATCH_SIZE
+    BATCH_SIZE = args.batchSize
+    global TIME_MS
+    TIME_MS = args.timeMs
+    global ARRAY_NODES
+    ARRAY_NODES = args.arrayNodes
+    global SELECTION
+    SELECTION = args.selection
+    global RAVE_EQUIV
+    RAVE_EQUIV = args.rave
+    global SOLVER
+    SOLVER = args.solver
+    global EXPAND_ALL
+    EXPAND_ALL = args.expandAll
+    global MAX_NODES
+    MAX_NODES = args.maxNodes
+    global SEARCH_LOG
+    if args.statsFile:
+        SEARCH_LOG = []
+    global ROLLOUT_POLICY
+    try:
+        ROLLOUT_POLICY = rolloutPolicies.makePolicy(args.rolloutPolicy, args.policyTable,
+                                                    geometry)
+    except (ValueError, IOError) as e:
+        p.error(str(e))
+    global BOOK
+    if args.book:
+        import openingBook
+        try:
+            BOOK = openingBook.loadBook(args.book, geometry)
+        except (ValueError, IOError) as e:
+            p.error(str(e))
+    if args.learnTable and args.rollouts <= 0:
+        p.error("--learnTable needs --rollouts")
     return args
 
 
@@ -230,7 +1252,7 @@ def randomMove(node):
     node.addMove(move)
     return move
 
-def runMultipleGames(numGames, args):
+def runMultipleGames(numGames, args, statsFile=None):
     """
     Runs numGames games, with no printing except for a report on which game 
     number is currently being played, and reports final number
@@ -238,12 +1260,16 @@ def runMultipleGames(numGames, args):
     player 2 is MCTS and how many rollouts to use. For multiple games, you
     probably do not want to include the --displayBoard option in args, as
     this will do lots of printing and make running relatively slow.
+    If statsFile is given, the SEARCH_LOG of each game is written to it.
     """
     player1GamesWon = 0
     draws = 0
+    stats = {}
     for i in range(numGames):
         print "Game " + str(i)
-        node = playGame(args)
+        node = playGame(args, stats)
+        if statsFile is not None:
+            writeSearchLog(statsFile, {"game": i})
         winner = node.state.value()
         if winner == 1:
             player1GamesWon += 1
@@ -251,44 +1277,104 @@ def runMultipleGames(numGames, args):
             draws += 1
     print "Player 1 games won: " + str(player1GamesWon) + "/" + str(numGames)
     print "Draws: " + str(draws) + "/" + str(numGames)
+    print "Rollouts carried over between moves: " + str(stats["reusedRollouts"])
+    printRolloutRate(stats)
 
-def playGame(args):
+def playGame(args, stats=None):
     """
     Play one game against another player.
     args specifies whether player 1 or player 2 is MCTS (
     or both if rolloutsSecondMCTSAgent is non-zero)
-    and how many rollouts to use.
+    and how many rollouts to use. If stats is a dictionary, the
+    number of rollouts carried over from one move's search to the
+    next is added to stats["reusedRollouts"], and MCTS adds the
+    rollouts it runs and the time it takes (see MCTS).
     Returns the final terminal node for the game.
     """
+    if stats is None:
+        stats = {}
+    stats.setdefault("reusedRollouts", 0)
     # Make start state and root of MCTS tree
-    start_state = game1.newGame()
-    root1 = Node(start_state, None)
+    start_state = game1.newGame(args.bitboard, args.height, args.width, args.connect)
+    shareNodes = TRANSPOSITIONS or SYMMETRY
+    root1 = Node(start_state, None, {} if shareNodes else None)
     if args.rolloutsSecondMCTSAgent != 0:
-        root2 = Node(start_state, None)
+        root2 = Node(start_state, None, {} if shareNodes else None)
 
-    # Run MCTS
-    node = root1
+    # Run MCTS. With SYMMETRY the root of a tree can hold the mirror image of
+    # the real position, so each tree has a flag saying whether it is flipped.
+    state = start_state
+    node, flipped = root1, False
     if args.rolloutsSecondMCTSAgent != 0:
-        node2 = root2
-    while not node.state.isTerminal():
-        if (not args.second and node.state.turn == 1) or \
-                (args.second and node.state.turn == -1):
-            move = MCTS(node, args.rollouts)
+        node2, flipped2 = root2, False
+    while not state.isTerminal():
+        if (not args.second and state.turn == 1) or \
+                (args.second and state.turn == -1):
+            move = mirrorMove(state, MCTS(node, args.rollouts, stats), flipped)
         else:
             if args.rolloutsSecondMCTSAgent == 0:
-                move = randomMove(node)
+                move = mirrorMove(state, randomMove(node), flipped)
             else:
-                move = MCTS(node2, args.rolloutsSecondMCTSAgent)
+                move = mirrorMove(state, MCTS(node2, args.rolloutsSecondMCTSAgent, stats),
+                                  flipped2)
         
-        node.addMove(move)
-        node = node.children[move]
+        state = state.nextState(move)
+        node, reused, flipped = advanceRoot(node, move, flipped)
+        stats["reusedRollouts"] += reused
         if args.rolloutsSecondMCTSAgent != 0:
-            node2.addMove(move)
-            node2 = node2.children[move]
+            node2, reused, flipped2 = advanceRoot(node2, move, flipped2)
+            stats["reusedRollouts"] += reused
+    if flipped:
+        return Node(state, None)
     return node
 
-            
-    
+def mirrorMove(state, move, flipped):
+    """
+    Converts a move between state's board and its mirror image if flipped
+    is True.
+    """
+    if flipped:
+        return state.geometry.width - 1 - move
+    return move
+
+def isMirroredChild(node, move, child):
+    """
+    Whether child, node's child for move, holds the mirror image of the
+    position move leads to (with SYMMETRY it can be shared with that
+    image).
+    """
+    return SYMMETRY and child.state.getKey() != node.state.nextState(move).getKey()
+
+def printRolloutRate(stats):
+    """
+    Prints the MCTS rollouts per second recorded in stats, if any searches ran,
+    and the number of nodes evicted to stay within MAX_NODES, if there is a budget.
+    """
+    if stats.get("searchTime", 0) > 0:
+        print "MCTS rollouts per second: %.0f" % (stats["rollouts"] / stats["searchTime"])
+    if MAX_NODES:
+        print "Nodes evicted: " + str(stats.get("evictedNodes", 0))
+
+def advanceRoot(root, move, flipped=False):
+    """
+    Plays move in a search tree: the child for move becomes the new root,
+    detached from root, and its siblings are dropped so that their subtrees
+    can be freed. A transposition table is cut down to the nodes still
+    reachable from the new root. move is a move on the real board, and
+    flipped says whether root holds the mirror image of the real position.
+    Returns the new root, the number of rollouts already in its subtree, and
+    whether the new root holds the mirror image of the new real position.
+    """
+    move = mirrorMove(root.state, move, flipped)
+    root.addMove(move)
+    child = root.children[move]
+    if isMirroredChild(root, move, child):
+        flipped = not flipped
+    root.children = {}
+    child.parent = None
+    if child.table is not None:
+        pruneTable(child)
+    return child, child.visits, flipped
 
 def main():
     """
@@ -297,12 +1383,22 @@ def main():
     """
     # Get commandline arguments
     args = parse_args()
+    statsFile = open(args.statsFile, "w") if args.statsFile else None
     
-    if args.numGames > 1:
-        runMultipleGames(args.numGames, args)
+    if args.learnTable:
+        args.rolloutsSecondMCTSAgent = args.rollouts
+        geometry = game1.getGeometry(args.height, args.width, args.connect)
+        table = rolloutPolicies.learnTable(max(args.numGames, 1),
+                                           lambda: playGame(args).state, geometry)
+        rolloutPolicies.saveTable(table, args.learnTable)
+    elif args.numGames > 1:
+        runMultipleGames(args.numGames, args, statsFile)
     else:
         # Play the game
-        node = playGame(args)
+        stats = {}
+        node = playGame(args, stats)
+        if statsFile is not None:
+            writeSearchLog(statsFile, {"game": 0})
     
         # Print result
         winner = node.state.value()
@@ -313,6 +1409,11 @@ def main():
             print "Player 2 wins"
         else:
             print "It's a draw"
+        print "Rollouts carried over between moves: " + str(stats["reusedRollouts"])
+        printRolloutRate(stats)
+    if statsFile is not None:
+        statsFile.close()
+    closePool()
             
             
 if __name__ == "__main__":
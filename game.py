@@ -67,18 +67,28 @@ class Directions:
                WEST: EAST,
                STOP: STOP}
 
-class Configuration:
+class Configuration(object):
     """
     A Configuration holds the (x,y) coordinate of a character, along with its
     traveling direction.
 
     The convention for positions, like a graph, is that (0,0) is the lower left corner, x increases
     horizontally and y increases vertically.  Therefore, north is the direction of increasing y, or (0,1).
+
+    Configurations are immutable, so their hash is computed once, when they are made.
     """
+    __slots__ = ('pos', 'direction', '_hash')
 
     def __init__(self, pos, direction):
-        self.pos = pos
-        self.direction = direction
+        object.__setattr__(self, 'pos', pos)
+        object.__setattr__(self, 'direction', direction)
+        object.__setattr__(self, '_hash', hash(hash(pos) + 13 * hash(direction)))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Configurations are immutable')
+
+    def __reduce__(self):
+        return Configuration, (self.pos, self.direction)
 
     def getPosition(self):
         return (self.pos)
@@ -91,13 +101,13 @@ class Configuration:
         return x == int(x) and y == int(y)
 
     def __eq__(self, other):
-        if other == None: return False
-        return (self.pos == other.pos and self.direction == other.direction)
+        if self is other: return True
+        if other is None: return False
+        return (self._hash == other._hash and self.pos == other.pos and
+                self.direction == other.direction)
 
     def __hash__(self):
-        x = hash(self.pos)
-        y = hash(self.direction)
-        return hash(x + 13 * y)
+        return self._hash
 
     def __str__(self):
         return "(x,y)="+str(self.pos)+", "+str(self.direction)
@@ -117,18 +127,36 @@ class Configuration:
             direction = self.direction # There is no stop direction
         return Configuration((x + dx, y+dy), direction)
 
-class AgentState:
+class AgentState(object):
     """
     AgentStates hold the state of an agent (configuration, speed, scared, etc).
-    """
 
-    def __init__( self, startConfiguration, isPacman ):
-        self.start = startConfiguration
-        self.configuration = startConfiguration
-        self.isPacman = isPacman
-        self.scaredTimer = 0
-        self.numCarrying = 0
-        self.numReturned = 0
+    AgentStates are immutable, so game states can share them; the rules make
+    changed copies with withConfiguration and withScaredTimer.  Their hash is
+    computed once, when they are made.
+    """
+    __slots__ = ('start', 'configuration', 'isPacman', 'scaredTimer', 'numCarrying',
+                 'numReturned', '_hash')
+
+    def __init__( self, startConfiguration, isPacman, configuration=None, scaredTimer=0,
+                  numCarrying=0, numReturned=0 ):
+        if configuration is None:
+            configuration = startConfiguration
+        setattr = object.__setattr__
+        setattr(self, 'start', startConfiguration)
+        setattr(self, 'configuration', configuration)
+        setattr(self, 'isPacman', isPacman)
+        setattr(self, 'scaredTimer', scaredTimer)
+        setattr(self, 'numCarrying', numCarrying)
+        setattr(self, 'numReturned', numReturned)
+        setattr(self, '_hash', hash(hash(configuration) + 13 * hash(scaredTimer)))
+
+    def __setattr__( self, name, value ):
+        raise AttributeError('AgentStates are immutable')
+
+    def __reduce__( self ):
+        return AgentState, (self.start, self.isPacman, self.configuration, self.scaredTimer,
+                            self.numCarrying, self.numReturned)
 
     def __str__( self ):
         if self.isPacman:
@@ -137,20 +165,34 @@ class AgentState:
             return "Ghost: " + str( self.configuration )
 
     def __eq__( self, other ):
-        if other == None:
+        if self is other:
+            return True
+        if other is None:
             return False
         return self.configuration == other.configuration and self.scaredTimer == other.scaredTimer
 
     def __hash__(self):
-        return hash(hash(self.configuration) + 13 * hash(self.scaredTimer))
+        return self._hash
 
     def copy( self ):
-        state = AgentState( self.start, self.isPacman )
-        state.configuration = self.configuration
-        state.scaredTimer = self.scaredTimer
-        state.numCarrying = self.numCarrying
-        state.numReturned = self.numReturned
-        return state
+        """
+        AgentStates are immutable, so the "copy" is this AgentState itself.
+        """
+        return self
+
+    def withConfiguration( self, configuration ):
+        """
+        Returns a copy of this AgentState with a different configuration.
+        """
+        return AgentState( self.start, self.isPacman, configuration, self.scaredTimer,
+                           self.numCarrying, self.numReturned )
+
+    def withScaredTimer( self, scaredTimer ):
+        """
+        Returns a copy of this AgentState with a different scared timer.
+        """
+        return AgentState( self.start, self.isPacman, self.configuration, scaredTimer,
+                           self.numCarrying, self.numReturned )
 
     def getPosition(self):
         if self.configuration == None: return None
@@ -161,9 +203,14 @@ class AgentState:
 
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
-    via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
-    y vertical and the origin (0,0) in the bottom left corner.
+    A 2-dimensional array of booleans.  Data is accessed via grid[x][y] where
+    (x,y) are positions on a Pacman map with x horizontal, y vertical and the
+    origin (0,0) in the bottom left corner.
+
+    The cells are stored as the bits of a single int, with (x,y) at bit
+    x * height + y.  Ints are immutable, so a copy shares its bits with the
+    original until one of them is written to, count() is a popcount, and the
+    hash is kept until the next write.
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
@@ -173,57 +220,70 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        self.bits = (1 << (width * height)) - 1 if initialValue else 0
+        self._hash = None
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
     def __getitem__(self, i):
-        return self.data[i]
+        if i < 0: i += self.width
+        if not 0 <= i < self.width: raise IndexError('Grid column index out of range')
+        return GridColumn(self, i)
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        column = self[key]
+        for y in range(self.height):
+            column[y] = item[y]
+
+    def get(self, x, y):
+        """
+        Returns the cell (x,y), like grid[x][y] but without building a GridColumn.
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return (self.bits >> (x * self.height + y)) & 1 == 1
+        return self[x][y] # negative indices wrap around, others raise IndexError
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
     def __eq__(self, other):
-        if other == None: return False
-        return self.data == other.data
+        if other is None: return False
+        return self.bits == other.bits and self.width == other.width and self.height == other.height
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        if self._hash is None:
+            self._hash = hash(self.bits)
+        return self._hash
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.bits = self.bits
+        g._hash = self._hash
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        return self.copy()
 
     def count(self, item =True ):
-        return sum([x.count(item) for x in self.data])
+        ones = bin(self.bits).count('1')
+        if item: return ones
+        return self.width * self.height - ones
 
     def asList(self, key = True):
+        bits = self.bits
+        if not key:
+            bits ^= (1 << (self.width * self.height)) - 1
         list = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
+        while bits:
+            lowest = bits & -bits
+            index = lowest.bit_length() - 1
+            list.append( self._cellIndexToPosition(index) )
+            bits ^= lowest
         return list
 
     def packBits(self):
@@ -274,6 +334,36 @@ class Grid:
                 bools.append(False)
         return bools
 
+class GridColumn:
+    """
+    Column x of a Grid, so that grid[x][y] reads and writes the cell (x,y).
+    """
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.offset = x * grid.height
+
+    def __getitem__(self, y):
+        if y < 0: y += self.grid.height
+        if not 0 <= y < self.grid.height: raise IndexError('Grid row index out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if y < 0: y += self.grid.height
+        if not 0 <= y < self.grid.height: raise IndexError('Grid row index out of range')
+        bit = 1 << (self.offset + y)
+        if value:
+            self.grid.bits |= bit
+        else:
+            self.grid.bits &= ~bit
+        self.grid._hash = None
+
+    def __len__(self):
+        return self.grid.height
+
+    def __iter__(self):
+        for y in range(self.grid.height):
+            yield self[y]
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -342,7 +432,7 @@ class Actions:
             dx, dy = vec
             next_y = y_int + dy
             next_x = x_int + dx
-            if not walls[next_x][next_y]: possible.append(dir)
+            if not walls.get(next_x, next_y): possible.append(dir)
 
         return possible
 
@@ -358,7 +448,7 @@ class Actions:
             if next_x < 0 or next_x == walls.width: continue
             next_y = y_int + dy
             if next_y < 0 or next_y == walls.height: continue
-            if not walls[next_x][next_y]: neighbors.append((next_x, next_y))
+            if not walls.get(next_x, next_y): neighbors.append((next_x, next_y))
         return neighbors
     getLegalNeighbors = staticmethod(getLegalNeighbors)
 
@@ -375,11 +465,15 @@ class GameStateData:
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        The food grid, the capsule list and the (immutable) AgentStates are
+        shared with the predecessor rather than copied.  Code changing the
+        food, the capsules or an agent must replace them with a changed copy.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
@@ -395,6 +489,7 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
@@ -403,10 +498,8 @@ class GameStateData:
         return state
 
     def copyAgentStates( self, agentStates ):
-        copiedStates = []
-        for agentState in agentStates:
-            copiedStates.append( agentState.copy() )
-        return copiedStates
+        # AgentStates are immutable, so the copy can share them
+        return agentStates[:]
 
     def __eq__( self, other ):
         """
@@ -434,7 +527,7 @@ class GameStateData:
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
+        map = [[None] * height for x in range(width)]
         if type(self.food) == type((1,2)):
             self.food = reconstituteGrid(self.food)
         for x in range(width):
@@ -455,7 +548,9 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = 'o'
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        rows = [''.join([map[x][y] for x in range(width)]) for y in range(height)]
+        rows.reverse()
+        return '\n'.join(rows) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr( self, hasFood, hasWall ):
         if hasFood:
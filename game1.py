@@ -1,47 +1,127 @@
 """
 game1.py
-This module represents the game of Connect 4.
+This module represents the game of Connect 4, and more generally Connect N
+on a board of any size (see Geometry).
 
 @author Bryce Wiedenbeck
 @author Anna Rafferty (adapted from original in Jan 2017)
 """
 
 
+import random
 import numpy as np
 
-HEIGHT = 6 # Height of the connect 4 board
-WIDTH = 8 # Width of the connect 4 board
-CONNECT = 4  # Number of items in a sequence necessary to win 
+HEIGHT = 6 # Default height of the connect 4 board
+WIDTH = 8 # Default width of the connect 4 board
+CONNECT = 4  # Default number of items in a sequence necessary to win 
+
+# The seed for Zobrist keys (see Geometry). It is fixed so keys are the same
+# in every process and every run.
+ZOBRIST_SEED = 4
+
+class Geometry(object):
+    """
+    The shape of a board: its height, width and the number of pieces in a
+    row needed to win, along with the tables that depend on them. Every
+    state of a game shares one Geometry; get it with getGeometry.
+    """
+
+    def __init__(self, height, width, connect):
+        if height < 1 or width < 1 or connect < 1:
+            raise ValueError("board size and connect length must be positive")
+        if connect > max(height, width):
+            raise ValueError("connect %d does not fit on a %dx%d board" % (connect, height, width))
+        self.height = height
+        self.width = width
+        self.connect = connect
+        # Zobrist hashing: one random 64-bit number per (player, cell). A
+        # state's key is the xor of the numbers for every piece on the board,
+        # so each move updates it with a single xor. Cells are numbered
+        # column * height + height-from-bottom.
+        zobristRandom = random.Random(ZOBRIST_SEED)
+        self.zobrist = [[zobristRandom.getrandbits(64) for cell in range(height * width)]
+                        for player in range(2)]
+        # Bitboard masks (see BitboardState): the bottom cell of every column,
+        # and every cell of the board (leaving out the empty bit at the top of
+        # each column), and the shifts between neighbouring cells in the
+        # vertical, horizontal and two diagonal directions.
+        self.bottomMask = sum(1 << (j * (height + 1)) for j in range(width))
+        self.boardMask = self.bottomMask * ((1 << height) - 1)
+        self.shifts = (1, height + 1, height, height + 2)
+
+    def pieceKey(self, player, column, height):
+        """
+        The Zobrist number for a piece of player (+1 or -1) at the given column
+        and height from the bottom.
+        """
+        return self.zobrist[0 if player == 1 else 1][column * self.height + height]
+
+    def fitsIn64Bits(self):
+        """
+        Returns True if a bitboard of this shape fits in a 64-bit int.
+        """
+        return (self.height + 1) * self.width <= 64
+
+    def __reduce__(self):
+        # unpickle (e.g. in a worker process) to the shared instance
+        return getGeometry, (self.height, self.width, self.connect)
+
+_geometries = {}
+
+def getGeometry(height=HEIGHT, width=WIDTH, connect=CONNECT):
+    """
+    Returns the Geometry for a board of the given shape, creating it the
+    first time it is asked for.
+    """
+    shape = (height, width, connect)
+    if shape not in _geometries:
+        _geometries[shape] = Geometry(height, width, connect)
+    return _geometries[shape]
 
 class State(object):
     """
     Represents a Connect 4 board.
     """
     
-    def __init__(self, state=None, move=None):
+    def __init__(self, state=None, move=None, height=HEIGHT, width=WIDTH, connect=CONNECT):
         """
         Constructor. Makes a copy of state if a 
         state is passed in (i.e., non-destructive).
+        Otherwise makes an empty board of the given height and width, on
+        which connect pieces in a row win.
         """
         
         if state == None:
-            self._board = np.zeros([HEIGHT, WIDTH], int)
-            self._heights = np.zeros(WIDTH, int)
+            self.geometry = getGeometry(height, width, connect)
+            self._board = np.zeros([height, width], int)
+            self._heights = np.zeros(width, int)
             self.turn = 1
+            self.key = 0
+            self.mirrorKey = 0 # key of the left-right mirror image of this state
         else:
+            self.geometry = state.geometry
             self._board = np.array(state._board)
             self._heights = np.array(state._heights)
             self.turn = -state.turn
+            self.key = state.key
+            self.mirrorKey = state.mirrorKey
+        self._lastMove = None # (row, column) of the most recently placed piece
+        self._won = None # cached result of _wins()
         if move != None:
-            self._board[HEIGHT - self._heights[move] - 1, move] = state.turn
+            geometry = self.geometry
+            row = geometry.height - self._heights[move] - 1
+            self._board[row, move] = state.turn
+            self.key ^= geometry.pieceKey(state.turn, move, self._heights[move])
+            self.mirrorKey ^= geometry.pieceKey(state.turn, geometry.width - 1 - move,
+                                                self._heights[move])
             self._heights[move] += 1
-        self.key = "".join(map(str, self._board.flat)) + str(self.turn)
+            self._lastMove = (row, move)
 
     def getMoves(self):
         """
         Returns a vector of columns that one can place a piece in.
         """
-        return np.nonzero(self._heights < HEIGHT)[0]
+        return np.nonzero(self._heights < self.geometry.height)[0]
 
     def nextState(self, move):
         """
@@ -67,9 +147,22 @@ class State(object):
     
     def getKey(self):
         """
-        Returns a string representing this state. 
+        Returns the Zobrist hash of this state, a 64-bit int.
         """
         return self.key
+
+    def getMirrorKey(self):
+        """
+        Returns the Zobrist hash of the left-right mirror image of this state.
+        """
+        return self.mirrorKey
+
+    def getCanonicalKey(self):
+        """
+        Returns a key shared by this state and its mirror image: the smaller
+        of their Zobrist hashes.
+        """
+        return min(self.key, self.mirrorKey)
     
 
     def value(self):
@@ -87,34 +180,368 @@ class State(object):
     def _wins(self):
         """
         Returns True if this state is a win for one of the players and False otherwise.
+        Only the player who just moved can have won, and only with a line through
+        the piece they placed, so just the four lines through that piece are checked.
+        The result is cached on the state.
+        """
+        if self._won is None:
+            self._won = self._lastMoveWins()
+        return self._won
+
+    def getHeights(self):
+        """
+        Returns the number of pieces in each column.
+        """
+        return list(self._heights)
+
+    def getWinningMoves(self, player):
+        """
+        Returns the columns in which a piece of player (+1 or -1) would
+        complete CONNECT in a row.
+        """
+        height = self.geometry.height
+        return [col for col in self.getMoves()
+                if self._completesLine(height - self._heights[col] - 1, col, player)]
+
+    def _lastMoveWins(self):
+        """
+        Returns True if the most recently placed piece completes CONNECT in a row.
+        """
+        if self._lastMove is None:
+            return False
+        row, col = self._lastMove
+        return self._completesLine(row, col, -self.turn)
+
+    def _completesLine(self, row, col, player):
         """
-        for j in range(WIDTH - CONNECT + 1):#start from left
-            for i in range(HEIGHT-1, HEIGHT - CONNECT, -1):#start from bottom
-                if self._board[i,j] == -self.turn:
-                    for k in range(1,CONNECT):#go up
-                        if self._board[i-k, j] != -self.turn:
-                            break
-                        if k == CONNECT - 1:
-                            return True
-                    for k in range(1,CONNECT):#go right
-                        if self._board[i, j+k] != -self.turn:
-                            break
-                        if k == CONNECT - 1:
-                            return True
-                    for k in range(1,CONNECT):#go up-right
-                        if self._board[i-k, j+k] != -self.turn:
-                            break
-                        if k == CONNECT - 1:
-                            return True
-            for i in range(HEIGHT - CONNECT, -1, -1):
-                if self._board[i,j] == -self.turn:
-                    for k in range(1,CONNECT):#go down-right
-                        if self._board[i+k, j+k] != -self.turn:
-                            break
-                        if k == CONNECT - 1:
-                            return True
+        Returns True if a piece of player at (row, col) would be part of
+        CONNECT in a row, counting the player's pieces next to it in each
+        direction. This looks at no more than CONNECT - 1 cells each way, so
+        it takes the same time on a board of any size.
+        """
+        height = self.geometry.height
+        width = self.geometry.width
+        connect = self.geometry.connect
+        for dr, dc in ((1, 0), (0, 1), (1, 1), (1, -1)):
+            count = 1
+            for sign in (1, -1):
+                r = row + sign * dr
+                c = col + sign * dc
+                while count < connect and 0 <= r < height and 0 <= c < width and \
+                        self._board[r, c] == player:
+                    count += 1
+                    r += sign * dr
+                    c += sign * dc
+            if count >= connect:
+                return True
         return False
 
+class BitboardState(object):
+    """
+    Represents a Connect 4 board as a pair of bitboards.
+
+    Column j of the board occupies bits j*(HEIGHT+1) to j*(HEIGHT+1)+HEIGHT-1
+    of each mask, with the lowest bit of a column being its bottom cell. The
+    extra bit at the top of every column is always empty, so shifting a mask
+    never carries a line of pieces from one column into the next. This has the
+    same interface as State, but making a move only copies two ints and a short
+    list instead of two NumPy arrays. Masks are Python ints, so boards too big
+    for 64 bits work too, just more slowly.
+    """
+
+    __slots__ = ("_first", "_second", "_heights", "_numMoves", "_won", "geometry", "key",
+                 "mirrorKey", "turn")
+
+    def __init__(self, state=None, move=None, height=HEIGHT, width=WIDTH, connect=CONNECT):
+        """
+        Constructor. Makes a copy of state if a
+        state is passed in (i.e., non-destructive).
+        Otherwise makes an empty board of the given height and width, on
+        which connect pieces in a row win.
+        """
+        if state is None:
+            self.geometry = getGeometry(height, width, connect)
+            self._first = 0 # pieces of the first player (+1)
+            self._second = 0 # pieces of the second player (-1)
+            self._heights = [0] * width
+            self._numMoves = 0
+            self.turn = 1
+            self.key = 0
+            self.mirrorKey = 0 # key of the left-right mirror image of this state
+        else:
+            self.geometry = state.geometry
+            self._first = state._first
+            self._second = state._second
+            self._heights = list(state._heights)
+            self._numMoves = state._numMoves
+            self.turn = -state.turn
+            self.key = state.key
+            self.mirrorKey = state.mirrorKey
+        self._won = None # cached result of _wins()
+        if move is not None:
+            geometry = self.geometry
+            bit = 1 << (move * (geometry.height + 1) + self._heights[move])
+            if state.turn == 1:
+                self._first |= bit
+            else:
+                self._second |= bit
+            self.key ^= geometry.pieceKey(state.turn, move, self._heights[move])
+            self.mirrorKey ^= geometry.pieceKey(state.turn, geometry.width - 1 - move,
+                                                self._heights[move])
+            self._heights[move] += 1
+            self._numMoves += 1
+
+    def getMoves(self):
+        """
+        Returns a list of columns that one can place a piece in.
+        """
+        height = self.geometry.height
+        return [j for j in range(self.geometry.width) if self._heights[j] < height]
+
+    def nextState(self, move):
+        """
+        Returns the State that would result from taking move in this state.
+        """
+        return BitboardState(self, move)
+
+    def isTerminal(self):
+        """
+        Returns True if one player has won or if there are no more moves (a draw).
+        Otherwise, returns False.
+        """
+        if self._numMoves == self.geometry.height * self.geometry.width:
+            return True
+        return self._wins()
+
+    def getTurn(self):
+        """
+        Returns +1 for the first player or -1 for the second player.
+        This is the player whose turn it is to move in this state.
+        """
+        return self.turn
+
+    def getKey(self):
+        """
+        Returns the Zobrist hash of this state, a 64-bit int. This is the
+        same key State gives for the same position.
+        """
+        return self.key
+
+    def getMirrorKey(self):
+        """
+        Returns the Zobrist hash of the left-right mirror image of this state.
+        """
+        return self.mirrorKey
+
+    def getCanonicalKey(self):
+        """
+        Returns a key shared by this state and its mirror image: the smaller
+        of their Zobrist hashes.
+        """
+        return min(self.key, self.mirrorKey)
+
+    def value(self):
+        """
+        Returns 0 if the state is a draw or hasn't been
+        won by anyone, returns 1 if it's a win for the first
+        player, and returns -1 if it's a win for the second player.
+        """
+        if self._wins():
+            return -self.turn
+        return 0
+
+    def _wins(self):
+        """
+        Returns True if the player who just moved has CONNECT in a row.
+        The result is cached on the state.
+        """
+        if self._won is None:
+            self._won = self._maskWins()
+        return self._won
+
+    def _maskWins(self):
+        """
+        Checks every line of the mover's mask with one shift-and per cell of
+        the line, for each of the four directions: 4 * (CONNECT - 1) shift-ands
+        whatever the size of the board.
+        """
+        if self.turn == 1:
+            mask = self._second
+        else:
+            mask = self._first
+        connect = self.geometry.connect
+        # vertical, horizontal and the two diagonals
+        for shift in self.geometry.shifts:
+            line = mask
+            for k in range(1, connect):
+                line &= mask >> (k * shift)
+            if line:
+                return True
+        return False
+
+    def getHeights(self):
+        """
+        Returns the number of pieces in each column.
+        """
+        return list(self._heights)
+
+    def getWinningMoves(self, player):
+        """
+        Returns the columns in which a piece of player (+1 or -1) would
+        complete CONNECT in a row.
+        """
+        geometry = self.geometry
+        mask = self._first if player == 1 else self._second
+        playable = ((self._first | self._second) + geometry.bottomMask) & geometry.boardMask
+        cells = _completingCells(mask, geometry) & playable
+        if not cells:
+            return []
+        stride = geometry.height + 1
+        column = (1 << stride) - 1
+        return [j for j in range(geometry.width) if cells & (column << (j * stride))]
+
+    @property
+    def _board(self):
+        """
+        The board as a HEIGHT x WIDTH array laid out like State._board, with
+        the top row first. Only used for printing.
+        """
+        height = self.geometry.height
+        board = np.zeros([height, self.geometry.width], int)
+        for j in range(self.geometry.width):
+            for h in range(self._heights[j]):
+                bit = 1 << (j * (height + 1) + h)
+                board[height - h - 1, j] = 1 if self._first & bit else -1
+        return board
+
+def childStates(state):
+    """
+    Returns a (move, state) pair for every legal move from state (a State or
+    BitboardState). Which of the new states are wins is worked out for all of
+    them at once with getWinningMoves, so none of them has to check itself.
+    """
+    wins = state.getWinningMoves(state.turn)
+    children = []
+    for move in state.getMoves():
+        child = state.nextState(move)
+        child._won = move in wins
+        children.append((move, child))
+    return children
+
+def _completingCells(mask, geometry):
+    """
+    Returns the bitboard of cells that would complete CONNECT in a row with
+    the pieces in mask: for each direction, and for each way of splitting the
+    other CONNECT - 1 pieces of the line between the two sides of the cell,
+    the cell qualifies if mask holds all of them.
+    """
+    cells = 0
+    for shift in geometry.shifts:
+        for before in range(geometry.connect):
+            line = geometry.boardMask
+            for k in range(1, before + 1):
+                line &= mask << (k * shift)
+            for k in range(1, geometry.connect - before):
+                line &= mask >> (k * shift)
+            cells |= line
+    return cells
+
+def _bitboards(state):
+    """
+    Returns the (first player, second player) bitboard masks of state,
+    in the BitboardState layout.
+    """
+    if isinstance(state, BitboardState):
+        return state._first, state._second
+    height = state.geometry.height
+    first = 0
+    second = 0
+    for j in range(state.geometry.width):
+        for h in range(state._heights[j]):
+            piece = state._board[height - h - 1, j]
+            bit = 1 << (j * (height + 1) + h)
+            if piece == 1:
+                first |= bit
+            else:
+                second |= bit
+    return first, second
+
+def rolloutBatch(states, rng=None):
+    """
+    Plays a uniformly random game to completion from each of the given states
+    and returns an array of their outcomes (as in State.value()).
+
+    All the games are played at once: the boards are packed into arrays of
+    64-bit masks and each step places one random piece in every unfinished
+    game with array operations, then tests the movers' masks for a win with
+    shifts. rng is the numpy RandomState to draw moves from. The states must
+    all have the same Geometry; boards too big for 64-bit masks are played
+    out one at a time instead.
+    """
+    if rng is None:
+        rng = np.random
+    n = len(states)
+    if n == 0:
+        return np.zeros(0, np.int64)
+    geometry = states[0].geometry
+    if not geometry.fitsIn64Bits():
+        return np.array([_randomPlayout(state, rng) for state in states], np.int64)
+    height, width, connect = geometry.height, geometry.width, geometry.connect
+    first = np.zeros(n, np.uint64)
+    second = np.zeros(n, np.uint64)
+    heights = np.zeros([n, width], np.int64)
+    turns = np.zeros(n, np.int64)
+    outcomes = np.zeros(n, np.int64)
+    active = np.zeros(n, bool)
+    for i, state in enumerate(states):
+        masks = _bitboards(state)
+        first[i] = masks[0]
+        second[i] = masks[1]
+        heights[i] = state._heights
+        turns[i] = state.turn
+        if state.isTerminal():
+            outcomes[i] = state.value()
+        else:
+            active[i] = True
+
+    one = np.uint64(1)
+    shifts = [np.uint64(shift) for shift in geometry.shifts]
+    while active.any():
+        games = np.nonzero(active)[0]
+        # pick a random open column in each game
+        scores = rng.random_sample([len(games), width])
+        scores[heights[games] >= height] = -1.
+        columns = scores.argmax(1)
+        bits = one << (columns * (height + 1) + heights[games, columns]).astype(np.uint64)
+        heights[games, columns] += 1
+
+        firstMoved = turns[games] == 1
+        first[games[firstMoved]] |= bits[firstMoved]
+        second[games[~firstMoved]] |= bits[~firstMoved]
+        masks = np.where(firstMoved, first[games], second[games])
+        won = np.zeros(len(games), bool)
+        for shift in shifts:
+            line = masks.copy()
+            for k in range(1, connect):
+                line &= masks >> (shift * np.uint64(k))
+            won |= line != 0
+
+        outcomes[games[won]] = turns[games[won]]
+        full = heights[games].sum(1) == height * width
+        active[games[won | full]] = False
+        turns[games] = -turns[games]
+    return outcomes
+
+def _randomPlayout(state, rng):
+    """
+    Plays uniformly random moves drawn from rng until the game is over and
+    returns its outcome (as in State.value()).
+    """
+    while not state.isTerminal():
+        moves = state.getMoves()
+        state = state.nextState(moves[rng.randint(len(moves))])
+    return state.value()
+
 def show_values(node):
     """
     Prints out the the board with a ranking of moves based on their values
@@ -123,32 +550,37 @@ def show_values(node):
     """
     values = sorted(set([c.value for c in node.children.values()]))
     move_rank = {m:1+values.index(c.value) for m,c in node.children.items()}
-    result = u"\n" + (" " + u"\u25a0")*WIDTH + u" \u25E9\n"
-    for i in range(HEIGHT):
+    height = node.state.geometry.height
+    width = node.state.geometry.width
+    result = u"\n" + (" " + u"\u25a0")*width + u" \u25E9\n"
+    for i in range(height):
         result +=  u"\u25A1" + " "
-        for j in range(WIDTH):
+        for j in range(width):
             move = j
-            if i == (HEIGHT - node.state._heights[j] - 1) and move_rank.get(move, 10) < 10:
+            if i == (height - node.state._heights[j] - 1) and move_rank.get(move, 10) < 10:
                 c = str(move_rank[move])
             else:
                 c = _print_char(node.state._board[i,j])
             result += c + " "
         result += u"\u25A1" + "\n"
-    result += u"\u25EA" + (" " + u"\u25a0") * WIDTH
+    result += u"\u25EA" + (" " + u"\u25a0") * width
     return result
 
 def print_board(state):
     """
     Print out the board in a human-readable form.
     """
-    result = u"\n" + (" " + u"\u25a0")*WIDTH + u" \u25E9\n"
-    for i in range(HEIGHT):
+    height = state.geometry.height
+    width = state.geometry.width
+    board = state._board
+    result = u"\n" + (" " + u"\u25a0")*width + u" \u25E9\n"
+    for i in range(height):
         result +=  u"\u25A1" + " "
-        for j in range(WIDTH):
-            c = _print_char(state._board[i,j])
+        for j in range(width):
+            c = _print_char(board[i,j])
             result += c + " "
         result += u"\u25A1" + "\n"
-    result += u"\u25EA" + (" " + u"\u25a0") * WIDTH
+    result += u"\u25EA" + (" " + u"\u25a0") * width
     return result
 
 def _print_char(i):
@@ -165,8 +597,12 @@ def _print_char(i):
         return u'\u25CF' # white piece
     return u'\u00B7' # empty cell
 
-def newGame():
+def newGame(bitboard=False, height=HEIGHT, width=WIDTH, connect=CONNECT):
     """
-    Get a state representing a new game of Connect 4.
+    Get a state representing a new game of Connect 4, or of Connect N on a
+    board of another size. If bitboard is True, the game uses the faster
+    BitboardState representation.
     """
-    return State()
+    if bitboard:
+        return BitboardState(None, None, height, width, connect)
+    return State(None, None, height, width, connect)
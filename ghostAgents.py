@@ -43,11 +43,16 @@ class RandomGhost( GhostAgent ):
         return dist
 
 class DirectionalGhost( GhostAgent ):
-    "A ghost that prefers to rush Pacman, or flee when scared."
-    def __init__( self, index, prob_attack=0.8, prob_scaredFlee=0.8 ):
+    """
+    A ghost that prefers to rush Pacman, or flee when scared. With
+    maze_distance set it judges how close Pacman is by maze distance rather
+    than Manhattan distance.
+    """
+    def __init__( self, index, prob_attack=0.8, prob_scaredFlee=0.8, maze_distance=False ):
         self.index = index
         self.prob_attack = prob_attack
         self.prob_scaredFlee = prob_scaredFlee
+        self.maze_distance = maze_distance
 
     def getDistribution( self, state ):
         # Read variables from state
@@ -64,7 +69,11 @@ class DirectionalGhost( GhostAgent ):
         pacmanPosition = state.getPacmanPosition()
 
         # Select best actions given the state
-        distancesToPacman = [manhattanDistance( pos, pacmanPosition ) for pos in newPositions]
+        if self.maze_distance:
+            distance = state.data.layout.mazeDistance
+        else:
+            distance = manhattanDistance
+        distancesToPacman = [distance( pos, pacmanPosition ) for pos in newPositions]
         if isScared:
             bestScore = max( distancesToPacman )
             bestProb = self.prob_scaredFlee
@@ -14,11 +14,26 @@
 
 from util import manhattanDistance
 from game import Grid
+from game import Actions
+from game import Directions
+from game import Configuration
 import os
 import random
+import hashlib
+import math
+import numpy as np
 
 VISIBILITY_MATRIX_CACHE = {}
 
+# Legal action tables by layout text, shared by all copies of a layout
+ACTION_TABLE_CACHE = {}
+
+# (cellIndex, distances) pairs by layout hash, and the directory the
+# distance matrices are saved in
+MAZE_DISTANCE_CACHE = {}
+MAZE_DISTANCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mazeDistances')
+UNREACHABLE = np.iinfo(np.uint16).max
+
 class Layout:
     """
     A Layout manages the static information about the game board.
@@ -35,35 +50,200 @@ class Layout:
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.initializeActionTables()
+        self.distances = None # computed by initializeMazeDistances when first needed
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
         return self.numGhosts
 
     def initializeVisibilityMatrix(self):
+        """
+        Sets self.visibility[x][y][direction] to the set of points, in half
+        steps, that can be seen from the open cell (x,y) looking in direction
+        before a wall gets in the way. Wall cells get None.
+        """
         global VISIBILITY_MATRIX_CACHE
         if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
             from game import Directions
             vecs = [(-0.5,0), (0.5,0),(0,-0.5),(0,0.5)]
-            dirs = [Directions.NORTH, Directions.SOUTH, Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH:set(), Directions.SOUTH:set(), Directions.EAST:set(), Directions.WEST:set(), Directions.STOP:set()})
+            dirs = [Directions.WEST, Directions.EAST, Directions.SOUTH, Directions.NORTH]
+            vis = [[None for y in range(self.height)] for x in range(self.width)]
             for x in range(self.width):
                 for y in range(self.height):
                     if self.walls[x][y] == False:
+                        vis[x][y] = {Directions.NORTH:set(), Directions.SOUTH:set(), Directions.EAST:set(), Directions.WEST:set(), Directions.STOP:set()}
                         for vec, direction in zip(vecs, dirs):
                             dx, dy = vec
                             nextx, nexty = x + dx, y + dy
                             while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)] :
                                 vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
+                                nextx, nexty = nextx + dx, nexty + dy
             self.visibility = vis
             VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
         else:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
 
+    def initializeActionTables(self):
+        """
+        Precomputes the legal actions of agents standing on the open cells
+        inside the border: pacmanActions maps a cell to Pacman's actions there,
+        and ghostActions maps a (cell, heading) pair to a ghost's. The tables
+        are built once per layout text and shared through ACTION_TABLE_CACHE.
+        """
+        key = "\n".join(self.layoutText)
+        if key in ACTION_TABLE_CACHE:
+            self.pacmanActions, self.ghostActions = ACTION_TABLE_CACHE[key]
+            return
+        self.pacmanActions = {}
+        self.ghostActions = {}
+        headings = Actions._directions.keys()
+        for x in range(1, self.width - 1):
+            for y in range(1, self.height - 1):
+                if self.walls[x][y]: continue
+                self.pacmanActions[(x, y)] = Actions.getPossibleActions(
+                    Configuration((x, y), Directions.STOP), self.walls)
+                for heading in headings:
+                    self.ghostActions[((x, y), heading)] = self.computeGhostActions(
+                        Configuration((x, y), heading))
+        ACTION_TABLE_CACHE[key] = (self.pacmanActions, self.ghostActions)
+
+    def getPacmanActions(self, config):
+        """
+        Returns a list of Pacman's legal actions in the given configuration.
+        """
+        actions = self.pacmanActions.get(config.pos)
+        if actions is None:
+            return Actions.getPossibleActions(config, self.walls)
+        return actions[:]
+
+    def getGhostActions(self, config):
+        """
+        Returns a list of a ghost's legal actions in the given configuration.
+        """
+        actions = self.ghostActions.get((config.pos, config.direction))
+        if actions is None:
+            return self.computeGhostActions(config)
+        return actions[:]
+
+    def computeGhostActions(self, config):
+        """
+        Ghosts cannot stop, and cannot turn around unless they
+        reach a dead end, but can turn 90 degrees at intersections.
+        """
+        possibleActions = Actions.getPossibleActions( config, self.walls )
+        reverse = Actions.reverseDirection( config.direction )
+        if Directions.STOP in possibleActions:
+            possibleActions.remove( Directions.STOP )
+        if reverse in possibleActions and len( possibleActions ) > 1:
+            possibleActions.remove( reverse )
+        return possibleActions
+
+    def getHash(self):
+        """
+        Returns a hash of the layout text, which names its maze distance table.
+        """
+        return hashlib.sha1("\n".join(self.layoutText)).hexdigest()
+
+    def initializeMazeDistances(self):
+        """
+        Sets cellIndex, which numbers the open cells, and distances, a uint16
+        matrix of the maze distances between every two of them (UNREACHABLE if
+        there is no path). The matrix is found by a breadth-first search from
+        every cell, and saved in MAZE_DISTANCE_DIR for the next time the layout
+        is loaded.
+        """
+        key = self.getHash()
+        if key not in MAZE_DISTANCE_CACHE:
+            cells = [(x, y) for x in range(self.width) for y in range(self.height)
+                     if not self.walls[x][y]]
+            self.cellIndex = dict((cell, i) for i, cell in enumerate(cells))
+            path = os.path.join(MAZE_DISTANCE_DIR, key + '.npy')
+            distances = None
+            if os.path.exists(path):
+                try:
+                    distances = np.load(path)
+                except (IOError, OSError, ValueError, EOFError):
+                    distances = None # unreadable, e.g. half written; recompute it
+                if distances is not None and distances.shape != (len(cells), len(cells)):
+                    distances = None
+            if distances is None:
+                distances = self.computeMazeDistances(cells)
+                try:
+                    if not os.path.isdir(MAZE_DISTANCE_DIR):
+                        os.makedirs(MAZE_DISTANCE_DIR)
+                    # Write to a private file first so readers never see part of one
+                    temp = '%s.%d.tmp' % (path, os.getpid())
+                    with open(temp, 'wb') as f:
+                        np.save(f, distances)
+                    os.rename(temp, path)
+                except (IOError, OSError):
+                    pass # the table is only a cache
+            MAZE_DISTANCE_CACHE[key] = (self.cellIndex, distances)
+        self.cellIndex, self.distances = MAZE_DISTANCE_CACHE[key]
+
+    def computeMazeDistances(self, cells):
+        """
+        Returns the matrix of maze distances between the given cells.
+        """
+        index = self.cellIndex
+        neighbors = [[index[n] for n in Actions.getLegalNeighbors(cell, self.walls)
+                      if n != cell and n in index] for cell in cells]
+        distances = np.empty((len(cells), len(cells)), np.uint16)
+        for source in range(len(cells)):
+            row = [UNREACHABLE] * len(cells)
+            row[source] = 0
+            frontier = [source]
+            distance = 0
+            while frontier:
+                distance += 1
+                nextFrontier = []
+                for i in frontier:
+                    for j in neighbors[i]:
+                        if row[j] == UNREACHABLE:
+                            row[j] = distance
+                            nextFrontier.append(j)
+                frontier = nextFrontier
+            distances[source] = row
+        return distances
+
+    def mazeDistance(self, a, b):
+        """
+        Returns the length of the shortest path through the maze between
+        positions a and b. A position between two cells, where a scared ghost
+        can be, is its distance along the corridor from each of them. A
+        position with no open cell around it falls back to the Manhattan
+        distance.
+        """
+        if self.distances is None:
+            self.initializeMazeDistances()
+        i = self.cellIndex.get(a)
+        j = self.cellIndex.get(b)
+        if i is not None and j is not None:
+            return self.distances.item(i, j)
+        cellsA = self.nearestCells(a)
+        cellsB = self.nearestCells(b)
+        if not cellsA or not cellsB:
+            return manhattanDistance(a, b)
+        return min(da + db + self.distances.item(i, j)
+                   for i, da in cellsA for j, db in cellsB)
+
+    def nearestCells(self, pos):
+        """
+        Returns (cell number, distance) pairs for the open cells around pos.
+        """
+        x, y = pos
+        cells = []
+        for cx in set([int(math.floor(x)), int(math.ceil(x))]):
+            for cy in set([int(math.floor(y)), int(math.ceil(y))]):
+                i = self.cellIndex.get((cx, cy))
+                if i is not None:
+                    cells.append((i, abs(x - cx) + abs(y - cy)))
+        return cells
+
     def isWall(self, pos):
         x, col = pos
-        return self.walls[x][col]
+        return self.walls.get(x, col)
 
     def getRandomLegalPosition(self):
         x = random.choice(range(self.width))
@@ -90,7 +270,10 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        layout = Layout(self.layoutText[:])
+        if self.distances is not None:
+            layout.cellIndex, layout.distances = self.cellIndex, self.distances
+        return layout
 
     def processLayoutText(self, layoutText):
         """
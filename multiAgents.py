@@ -338,12 +338,15 @@ def betterEvaluationFunction(currentGameState):
     evaluation function (question 5).
 
     DESCRIPTION:
-    The evaluation function here deals with 2 situations: when ghost is close (within 3 steps) or far
-    1.when ghost is far away, the evaluation doesn't care about where the ghost is but only evaluates the closest food
+    The evaluation function here deals with 3 situations: when the closest ghost is scared for long enough
+    to be caught, close (within 4 steps) or far
+    1.when the ghost can be caught, the evaluation chases it (subtracting the distance to the ghost)
+    2.when ghost is far away, the evaluation doesn't care about where the ghost is but only evaluates the closest food
     (subtracting the distance from the closest food. The further the closest food is, the smaller evaluation is.)
-    2.when ghost is close, the evaluation considers both the ghost distance and also the closest food.
-    (substracting both distances from closest food and closest ghost from terminal utility, therefore, the further
-    the closest food is, or the closer the closest ghost is, the smaller evaluation is)
+    3.when ghost is close, the evaluation considers both the ghost distance and also the closest food.
+    (substracting both a penalty for the closest ghost and the distance to the closest food from terminal utility,
+    therefore, the further the closest food is, or the closer the closest ghost is, the smaller evaluation is)
+    Distances are maze distances, looked up in the layout's precomputed table.
     """
     "*** YOUR CODE HERE ***"
     ghostPositions = currentGameState.getGhostPositions()
@@ -351,8 +354,9 @@ def betterEvaluationFunction(currentGameState):
     foodGrid = currentGameState.getFood()
     foodList = foodGrid.asList()
 
-    foodDifferences = [_manhattanDistance(foodPosition, pacmanPosition) for foodPosition in foodList]
-    positionDifferences = [_manhattanDistance(ghostPosition, pacmanPosition) for ghostPosition in ghostPositions]
+    mazeDistance = currentGameState.data.layout.mazeDistance
+    foodDifferences = [mazeDistance(foodPosition, pacmanPosition) for foodPosition in foodList]
+    positionDifferences = [mazeDistance(ghostPosition, pacmanPosition) for ghostPosition in ghostPositions]
     mini = minIndex(positionDifferences)
     if foodDifferences == []:
         foodEval = 0
@@ -360,8 +364,10 @@ def betterEvaluationFunction(currentGameState):
         mini2 = minIndex(foodDifferences)
         foodEval = foodDifferences[mini2]
 
-    if positionDifferences[mini] <= 3:
-        evalFunc = currentGameState.getScore() - positionDifferences[mini] - foodEval
+    if currentGameState.getGhostStates()[mini].scaredTimer > positionDifferences[mini]:
+        evalFunc = currentGameState.getScore() - positionDifferences[mini]
+    elif positionDifferences[mini] <= 4:
+        evalFunc = currentGameState.getScore() - (5 - positionDifferences[mini]) - foodEval
     else:
         evalFunc = currentGameState.getScore() - foodEval
 
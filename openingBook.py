@@ -0,0 +1,165 @@
+"""
+openingBook.py
+An opening book for Connect 4: the move MCTS chose, after a deep search, in
+every position of the first few plies. Positions are keyed by their Zobrist
+key, with each position and its left-right mirror image folded together under
+the smaller of their two keys, so only one of them needs searching.
+
+Build a book of the first 4 plies, with 20000 rollouts per position, using
+8 processes:
+
+    python openingBook.py --build book.npz --plies 4 --rollouts 20000 --workers 8
+
+and play from it with MCTS.py --book book.npz.
+"""
+
+import argparse
+import multiprocessing
+import random
+import numpy as np
+
+import game1
+import MCTS
+
+
+class OpeningBook(object):
+    """
+    Maps canonical position keys to the book move, stored as seen in the
+    orientation with the canonical key, for positions on boards of one
+    game1.Geometry (by default Connect 4's).
+    """
+
+    def __init__(self, moves=None, geometry=None):
+        self.moves = moves if moves is not None else {}
+        self.geometry = geometry or game1.getGeometry()
+
+    def lookup(self, state):
+        """
+        Returns the book move for state, or None if state is not in the book.
+        """
+        key = state.getKey()
+        mirrored = state.getMirrorKey()
+        move = self.moves.get(state.getCanonicalKey())
+        if move is None or key <= mirrored:
+            return move
+        return self.geometry.width - 1 - move
+
+    def add(self, state, move):
+        """
+        Records move as the book move for state.
+        """
+        if state.getKey() > state.getMirrorKey():
+            move = self.geometry.width - 1 - move
+        self.moves[state.getCanonicalKey()] = move
+
+    def __len__(self):
+        return len(self.moves)
+
+    def save(self, path):
+        """
+        Writes the book as a compressed numpy archive of sorted keys and moves.
+        """
+        keys = np.array(sorted(self.moves), np.uint64)
+        moves = np.array([self.moves[key] for key in sorted(self.moves)], np.uint8)
+        geometry = np.array([self.geometry.height, self.geometry.width, self.geometry.connect])
+        np.savez_compressed(path, keys=keys, moves=moves, geometry=geometry)
+
+def loadBook(path, geometry=None):
+    """
+    Reads a book written by OpeningBook.save, which must be for boards of the
+    given game1.Geometry (by default Connect 4's).
+    """
+    geometry = geometry or game1.getGeometry()
+    data = np.load(path)
+    if list(data["geometry"]) != [geometry.height, geometry.width, geometry.connect]:
+        raise ValueError("opening book %s is for a %dx%d connect-%d board" %
+                         ((path,) + tuple(data["geometry"])))
+    return OpeningBook(dict(zip((int(key) for key in data["keys"]),
+                                (int(move) for move in data["moves"]))), geometry)
+
+def bookPositions(plies, geometry=None):
+    """
+    Returns one state for each position, up to mirror images, that can arise
+    in the first plies moves of a game on a board of the given game1.Geometry
+    and is not over.
+    """
+    geometry = geometry or game1.getGeometry()
+    positions = []
+    seen = set()
+    frontier = [game1.newGame(True, geometry.height, geometry.width, geometry.connect)]
+    for ply in range(plies):
+        nextFrontier = []
+        for state in frontier:
+            canonical = state.getCanonicalKey()
+            if canonical in seen or state.isTerminal():
+                continue
+            seen.add(canonical)
+            positions.append(state)
+            nextFrontier.extend(state.nextState(move) for move in state.getMoves())
+        frontier = nextFrontier
+    return positions
+
+def searchPosition(job):
+    """
+    Runs MCTS from a state (in a worker process) and returns the chosen move.
+    """
+    state, rollouts, seed = job
+    random.seed(seed)
+    return MCTS.MCTS(MCTS.Node(state, None), rollouts)
+
+def buildBook(plies, rollouts, workers, seed=0, geometry=None):
+    """
+    Searches every position of the first plies moves with the given number of
+    rollouts and returns the resulting book.
+    """
+    geometry = geometry or game1.getGeometry()
+    positions = bookPositions(plies, geometry)
+    jobs = [(state, rollouts, seed + i) for i, state in enumerate(positions)]
+    book = OpeningBook(geometry=geometry)
+    pool = multiprocessing.Pool(workers)
+    try:
+        for i, move in enumerate(pool.imap(searchPosition, jobs)):
+            book.add(positions[i], move)
+            print "Searched position %d/%d" % (i + 1, len(positions))
+    finally:
+        pool.close()
+        pool.join()
+    return book
+
+def parse_args():
+    """
+    Parse command line arguments.
+    """
+    p = argparse.ArgumentParser()
+    p.add_argument("--build", required=True, help="File to write the book to (.npz).")
+    p.add_argument("--plies", type=int, default=4, help="Number of opening plies "+\
+                    "to cover. Default=4")
+    p.add_argument("--rollouts", type=int, default=10000, help="MCTS rollouts per "+\
+                    "position. Default=10000")
+    p.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="Number "+\
+                    "of processes to search positions in. Default=number of CPUs")
+    p.add_argument("--seed", type=int, default=0, help="Base random seed. Default=0")
+    p.add_argument("--height", type=int, default=game1.HEIGHT, help="Number of rows "+\
+                    "on the board. Default=" + str(game1.HEIGHT))
+    p.add_argument("--width", type=int, default=game1.WIDTH, help="Number of columns "+\
+                    "on the board. Default=" + str(game1.WIDTH))
+    p.add_argument("--connect", type=int, default=game1.CONNECT, help="Number of pieces "+\
+                    "in a row needed to win. Default=" + str(game1.CONNECT))
+    args = p.parse_args()
+    try:
+        args.geometry = game1.getGeometry(args.height, args.width, args.connect)
+    except ValueError as e:
+        p.error(str(e))
+    return args
+
+def main():
+    """
+    Builds an opening book as described by the command line arguments.
+    """
+    args = parse_args()
+    book = buildBook(args.plies, args.rollouts, args.workers, args.seed, args.geometry)
+    book.save(args.build)
+    print "Saved %d positions to %s" % (len(book), args.build)
+
+if __name__ == "__main__":
+    main()
@@ -43,6 +43,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -112,7 +113,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state, agentIndex )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -140,7 +141,7 @@ class GameState:
         state.pos gives the current position
         state.direction gives the travel vector
         """
-        return self.data.agentStates[0].copy()
+        return self.data.agentStates[0]
 
     def getPacmanPosition( self ):
         return self.data.agentStates[0].getPosition()
@@ -201,10 +202,10 @@ class GameState:
         return self.data.layout.walls
 
     def hasFood(self, x, y):
-        return self.data.food[x][y]
+        return self.data.food.get(x, y)
 
     def hasWall(self, x, y):
-        return self.data.layout.walls[x][y]
+        return self.data.layout.walls.get(x, y)
 
     def isLose( self ):
         return self.data._lose
@@ -331,7 +332,7 @@ class PacmanRules:
         """
         Returns a list of possible actions.
         """
-        return Actions.getPossibleActions( state.getPacmanState().configuration, state.data.layout.walls )
+        return state.data.layout.getPacmanActions( state.getPacmanState().configuration )
     getLegalActions = staticmethod( getLegalActions )
 
     def applyAction( state, action ):
@@ -346,7 +347,8 @@ class PacmanRules:
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
-        pacmanState.configuration = pacmanState.configuration.generateSuccessor( vector )
+        pacmanState = pacmanState.withConfiguration( pacmanState.configuration.generateSuccessor( vector ) )
+        state.data.agentStates[0] = pacmanState
 
         # Eat
         next = pacmanState.configuration.getPosition()
@@ -359,7 +361,7 @@ class PacmanRules:
     def consume( position, state ):
         x,y = position
         # Eat food
-        if state.data.food[x][y]:
+        if state.data.food.get(x, y):
             state.data.scoreChange += 10
             state.data.food = state.data.food.copy()
             state.data.food[x][y] = False
@@ -371,11 +373,12 @@ class PacmanRules:
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
+            state.data.capsules = state.data.capsules[:]
             state.data.capsules.remove( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.agentStates[index] = state.data.agentStates[index].withScaredTimer( SCARED_TIME )
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -388,14 +391,7 @@ class GhostRules:
         Ghosts cannot stop, and cannot turn around unless they
         reach a dead end, but can turn 90 degrees at intersections.
         """
-        conf = state.getGhostState( ghostIndex ).configuration
-        possibleActions = Actions.getPossibleActions( conf, state.data.layout.walls )
-        reverse = Actions.reverseDirection( conf.direction )
-        if Directions.STOP in possibleActions:
-            possibleActions.remove( Directions.STOP )
-        if reverse in possibleActions and len( possibleActions ) > 1:
-            possibleActions.remove( reverse )
-        return possibleActions
+        return state.data.layout.getGhostActions( state.getGhostState( ghostIndex ).configuration )
     getLegalActions = staticmethod( getLegalActions )
 
     def applyAction( state, action, ghostIndex):
@@ -408,14 +404,18 @@ class GhostRules:
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
-        ghostState.configuration = ghostState.configuration.generateSuccessor( vector )
+        state.data.agentStates[ghostIndex] = ghostState.withConfiguration(
+            ghostState.configuration.generateSuccessor( vector ) )
     applyAction = staticmethod( applyAction )
 
-    def decrementTimer( ghostState):
+    def decrementTimer( state, ghostIndex ):
+        ghostState = state.data.agentStates[ghostIndex]
         timer = ghostState.scaredTimer
+        if timer == 0: return
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
-        ghostState.scaredTimer = max( 0, timer - 1 )
+            conf = ghostState.configuration
+            ghostState = ghostState.withConfiguration( Configuration( nearestPoint( conf.pos ), conf.direction ) )
+        state.data.agentStates[ghostIndex] = ghostState.withScaredTimer( timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
     def checkDeath( state, agentIndex):
@@ -436,8 +436,7 @@ class GhostRules:
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
-            GhostRules.placeGhost(state, ghostState)
-            ghostState.scaredTimer = 0
+            state.data.agentStates[agentIndex] = GhostRules.placeGhost(state, ghostState).withScaredTimer( 0 )
             # Added for first-person
             state.data._eaten[agentIndex] = True
         else:
@@ -451,7 +450,10 @@ class GhostRules:
     canKill = staticmethod( canKill )
 
     def placeGhost(state, ghostState):
-        ghostState.configuration = ghostState.start
+        """
+        Returns ghostState moved back to its starting configuration.
+        """
+        return ghostState.withConfiguration( ghostState.start )
     placeGhost = staticmethod( placeGhost )
 
 #############################
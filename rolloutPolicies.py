@@ -0,0 +1,177 @@
+"""
+rolloutPolicies.py
+Policies for choosing moves in MCTS rollouts (the random games played by
+MCTS.simulate). Each policy has a getMove(state) method returning a legal
+move in a non-terminal game1 state. They work with either State
+representation, but are cheapest with BitboardState, whose getWinningMoves
+is a handful of shifts.
+
+Policies can be named on the MCTS command line with --rolloutPolicy, and
+combined with commas, e.g. "tactical,center" checks for immediate wins and
+blocks and otherwise prefers central columns.
+
+A table for TablePolicy can be learned from MCTS self-play with
+    python MCTS.py --learnTable table.txt --numGames 20 --rollouts 200
+adding --height, --width and --connect to learn one for another board.
+"""
+
+import random
+import game1
+
+
+class RandomPolicy(object):
+    """
+    Picks a legal move uniformly at random, like the original simulate.
+    """
+
+    def getMove(self, state):
+        moves = state.getMoves()
+        return moves[random.randint(0, len(moves) - 1)]
+
+
+class TacticalPolicy(object):
+    """
+    Wins immediately if it can, otherwise blocks an immediate win for the
+    opponent, otherwise defers to another policy (random by default).
+    """
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or RandomPolicy()
+
+    def getMove(self, state):
+        moves = state.getWinningMoves(state.getTurn())
+        if not moves:
+            moves = state.getWinningMoves(-state.getTurn())
+        if moves:
+            return moves[random.randint(0, len(moves) - 1)]
+        return self.fallback.getMove(state)
+
+
+class TablePolicy(object):
+    """
+    Picks a legal move with probability proportional to the weight of the cell
+    the piece would land in. table is a list of HEIGHT rows of WIDTH weights,
+    top row first (the layout print_board uses), for boards of the given
+    game1.Geometry (the default Connect 4 board if None). The default table
+    counts the lines of CONNECT cells through each cell, which favours the
+    center.
+    """
+
+    def __init__(self, table=None, geometry=None):
+        geometry = geometry or game1.getGeometry()
+        if table is None:
+            table = lineCountTable(geometry)
+        height = geometry.height
+        # weights[column][height] is the weight of a piece landing at that height
+        self.weights = [[table[height - h - 1][j] for h in range(height)]
+                        for j in range(geometry.width)]
+
+    def getMove(self, state):
+        moves = state.getMoves()
+        heights = state.getHeights()
+        weights = [self.weights[move][heights[move]] for move in moves]
+        threshold = random.random() * sum(weights)
+        for move, weight in zip(moves, weights):
+            threshold -= weight
+            if threshold < 0:
+                return move
+        return moves[-1]
+
+
+class CenterPolicy(TablePolicy):
+    """
+    Picks a legal move with probability proportional to how close its column
+    is to the center: the edge columns get weight 1, the next ones in 2, etc.
+    """
+
+    def __init__(self, geometry=None):
+        geometry = geometry or game1.getGeometry()
+        width = geometry.width
+        weights = [1 + min(j, width - 1 - j) for j in range(width)]
+        TablePolicy.__init__(self, [weights] * geometry.height, geometry)
+
+
+def lineCountTable(geometry=None):
+    """
+    Returns a table with the number of lines of CONNECT cells through each
+    cell of a board of the given game1.Geometry (by default Connect 4's).
+    """
+    geometry = geometry or game1.getGeometry()
+    height, width = geometry.height, geometry.width
+    table = [[0] * width for i in range(height)]
+    for i in range(height):
+        for j in range(width):
+            for di, dj in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                cells = [(i + k * di, j + k * dj) for k in range(geometry.connect)]
+                if all(0 <= r < height and 0 <= c < width for r, c in cells):
+                    for r, c in cells:
+                        table[r][c] += 1
+    return table
+
+def loadTable(path, geometry=None):
+    """
+    Reads a table for TablePolicy: HEIGHT lines of WIDTH numbers, top row first,
+    for a board of the given game1.Geometry (by default Connect 4's).
+    """
+    geometry = geometry or game1.getGeometry()
+    with open(path) as f:
+        table = [[float(x) for x in line.split()] for line in f if line.strip()]
+    if len(table) != geometry.height or any(len(row) != geometry.width for row in table):
+        raise ValueError("policy table %s is not %dx%d" % (path, geometry.height, geometry.width))
+    return table
+
+def saveTable(table, path):
+    """
+    Writes a table in the format loadTable reads.
+    """
+    with open(path, "w") as f:
+        for row in table:
+            f.write(" ".join("%.4f" % x for x in row) + "\n")
+
+def makePolicy(name, tablePath=None, geometry=None):
+    """
+    Builds the policy named on the command line: "random", "tactical",
+    "center" or "table", or "tactical," followed by one of the others to
+    use it when there is no immediate win or block. tablePath is the table
+    file for "table"; without one, TablePolicy's default table is used.
+    geometry is the game1.Geometry of the boards the policy will play on.
+    Returns None for "random", meaning MCTS's built-in uniform rollouts.
+    """
+    names = name.split(",")
+    policy = None
+    base = names[-1]
+    if base == "center":
+        policy = CenterPolicy(geometry)
+    elif base == "table":
+        policy = TablePolicy(loadTable(tablePath, geometry) if tablePath else None, geometry)
+    elif base not in ("random", "tactical"):
+        raise ValueError("unknown rollout policy: " + base)
+    if "tactical" in names:
+        policy = TacticalPolicy(policy)
+    elif len(names) > 1:
+        raise ValueError("only tactical can be combined with another policy: " + name)
+    return policy
+
+def learnTable(numGames, playGame, geometry=None):
+    """
+    Learns a TablePolicy table from self-play on boards of the given
+    game1.Geometry (by default Connect 4's). playGame is called with no
+    arguments to play each game and returns its final state. Each cell's
+    weight is one plus the number of games whose winner had a piece there
+    at the end, scaled so the weights average to one.
+    """
+    geometry = geometry or game1.getGeometry()
+    height, width = geometry.height, geometry.width
+    counts = [[1.] * width for i in range(height)]
+    for i in range(numGames):
+        state = playGame()
+        winner = state.value()
+        if winner == 0:
+            continue
+        board = state._board
+        for row in range(height):
+            for column in range(width):
+                if board[row, column] == winner:
+                    counts[row][column] += 1
+    mean = sum(map(sum, counts)) / (height * width)
+    return [[x / mean for x in row] for row in counts]
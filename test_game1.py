@@ -0,0 +1,91 @@
+"""
+test_game1.py
+Checks of the Connect 4 state representations in game1.py. Run with
+    python -m unittest discover -p "test_*.py"
+"""
+
+import random
+import unittest
+
+import game1
+
+
+def referenceWins(board, player, connect):
+    """
+    Whether player has connect pieces in a row on board (a State._board
+    array), found by trying every line of the board.
+    """
+    height, width = board.shape
+    for i in range(height):
+        for j in range(width):
+            for di, dj in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                cells = [(i + k * di, j + k * dj) for k in range(connect)]
+                if all(0 <= r < height and 0 <= c < width and board[r, c] == player
+                       for r, c in cells):
+                    return True
+    return False
+
+def randomGames(numGames, seed, height=game1.HEIGHT, width=game1.WIDTH, connect=game1.CONNECT):
+    """
+    Yields the (State, BitboardState) pairs of every position of numGames
+    random games played on both representations at once.
+    """
+    rng = random.Random(seed)
+    for i in range(numGames):
+        a = game1.newGame(False, height, width, connect)
+        b = game1.newGame(True, height, width, connect)
+        while True:
+            yield a, b
+            if b.isTerminal():
+                break
+            move = rng.choice(list(b.getMoves()))
+            a = a.nextState(move)
+            b = b.nextState(move)
+
+
+class BitboardStateTest(unittest.TestCase):
+
+    def checkAgreement(self, numGames, seed, height=game1.HEIGHT, width=game1.WIDTH,
+                       connect=game1.CONNECT):
+        for a, b in randomGames(numGames, seed, height, width, connect):
+            self.assertEqual(list(a.getMoves()), list(b.getMoves()))
+            self.assertEqual(list(a.getHeights()), list(b.getHeights()))
+            self.assertTrue((a._board == b._board).all())
+            self.assertEqual(a.getKey(), b.getKey())
+            self.assertEqual(a.getMirrorKey(), b.getMirrorKey())
+            self.assertEqual(a.getCanonicalKey(), b.getCanonicalKey())
+            won = referenceWins(a._board, -a.turn, connect)
+            self.assertEqual(a.isTerminal(), b.isTerminal())
+            self.assertEqual(a.value(), b.value())
+            if won:
+                self.assertEqual(b.value(), -b.turn)
+            if not b.isTerminal():
+                for player in (1, -1):
+                    self.assertEqual(sorted(a.getWinningMoves(player)),
+                                     sorted(b.getWinningMoves(player)))
+
+    def testAgreesWithState(self):
+        self.checkAgreement(60, 1)
+
+    def testAgreesWithStateOnOtherGeometries(self):
+        self.checkAgreement(15, 2, 7, 9, 5)
+        self.checkAgreement(15, 3, 4, 5, 3)
+
+    def testWinningMovesWin(self):
+        for a, b in randomGames(30, 4):
+            if b.isTerminal():
+                continue
+            for move in b.getMoves():
+                child = a.nextState(move)
+                wins = referenceWins(child._board, b.turn, b.geometry.connect)
+                self.assertEqual(move in b.getWinningMoves(b.turn), wins)
+
+    def testKeysIgnoreMoveOrder(self):
+        for bitboard in (False, True):
+            s1 = game1.newGame(bitboard).nextState(0).nextState(1).nextState(2).nextState(3)
+            s2 = game1.newGame(bitboard).nextState(2).nextState(3).nextState(0).nextState(1)
+            self.assertEqual(s1.getKey(), s2.getKey())
+
+
+if __name__ == "__main__":
+    unittest.main()
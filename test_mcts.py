@@ -0,0 +1,167 @@
+"""
+test_mcts.py
+Checks of the search and rollout code in MCTS.py. Run with
+    python -m unittest discover -p "test_*.py"
+"""
+
+import random
+import unittest
+
+import numpy as np
+
+import game1
+import MCTS
+
+
+class RolloutBatchTest(unittest.TestCase):
+
+    def outcomeFrequencies(self, outcomes):
+        outcomes = list(outcomes)
+        return [outcomes.count(outcome) / float(len(outcomes)) for outcome in (1, 0, -1)]
+
+    def testMatchesSimulateState(self):
+        rng = random.Random(1)
+        games = 1500
+        for plies in (0, 6, 14):
+            state = game1.newGame(True)
+            for i in range(plies):
+                state = state.nextState(rng.choice(state.getMoves()))
+            if state.isTerminal():
+                continue
+            random.seed(plies)
+            serial = self.outcomeFrequencies(MCTS.simulateState(state) for i in range(games))
+            batched = self.outcomeFrequencies(
+                game1.rolloutBatch([state] * games, np.random.RandomState(plies)))
+            for a, b in zip(serial, batched):
+                # about four standard deviations of the difference
+                self.assertAlmostEqual(a, b, delta=.06)
+
+    def testTerminalStates(self):
+        state = game1.newGame(True)
+        for move in (0, 1, 0, 1, 0, 1, 0):
+            state = state.nextState(move)
+        self.assertTrue(state.isTerminal())
+        self.assertEqual(list(game1.rolloutBatch([state, state])), [1, 1])
+
+
+def minimaxValue(state, cache):
+    """
+    Exact game value of state for the player to move: 1 for a win, -1 for a
+    loss and 0 for a draw with best play by both sides.
+    """
+    key = state.getKey()
+    if key not in cache:
+        if state.isTerminal():
+            cache[key] = state.value() * state.getTurn()
+        else:
+            cache[key] = max(-minimaxValue(state.nextState(move), cache)
+                             for move in state.getMoves())
+    return cache[key]
+
+
+class SettingsTestCase(unittest.TestCase):
+    """
+    Restores MCTS's search settings after each test, so tests can change them.
+    """
+
+    def setUp(self):
+        self.settings = MCTS.searchSettings()
+
+    def tearDown(self):
+        MCTS.applySearchSettings(self.settings)
+
+
+class SolverTest(SettingsTestCase):
+
+    def checkProofs(self, shareNodes, expandAll):
+        MCTS.SOLVER = True
+        MCTS.TRANSPOSITIONS = shareNodes
+        MCTS.EXPAND_ALL = expandAll
+        random.seed(5)
+        cache = {}
+        root = MCTS.Node(game1.newGame(True, 3, 4, 3), None, {} if shareNodes else None)
+        MCTS.search(root, 4000)
+        proven = 0
+        for node in MCTS.treeNodes(root):
+            if node.proven:
+                proven += 1
+                self.assertEqual(node.proven, minimaxValue(node.state, cache))
+        self.assertTrue(proven > 0)
+        self.assertTrue(root.proven)
+
+    def testProofsMatchMinimax(self):
+        self.checkProofs(False, False)
+
+    def testProofsMatchMinimaxWithTranspositions(self):
+        self.checkProofs(True, False)
+
+    def testProofsMatchMinimaxWithExpandAll(self):
+        self.checkProofs(False, True)
+
+
+
+class RaveTest(SettingsTestCase):
+
+    def testAmafMovesFollowMirroredNodes(self):
+        MCTS.SYMMETRY = True
+        table = {}
+        # on a seven-column board, column j mirrors to 6 - j
+        start = game1.newGame(True, 6, 7, 4).nextState(0)
+        root = MCTS.Node(start, None, table)
+        # the node for the mirror image of start + 1 becomes root's child for 1
+        mirrored = MCTS.Node(game1.newGame(True, 6, 7, 4).nextState(6).nextState(5), None, table)
+        root.addMove(1)
+        self.assertTrue(root.children[1] is mirrored)
+        self.assertTrue(MCTS.isMirroredChild(root, 1, mirrored))
+        for move in (2, 4):
+            root.addMove(move)
+            mirrored.addMove(move)
+        # played moves are on mirrored's board: 2 and 4 there are 4 and 2 at root
+        MCTS.updateAmafStats([root, mirrored], [2, 4], 1)
+        self.assertEqual(mirrored.amafVisits, 1)
+        self.assertEqual(root.children[2].amafVisits, 1)
+        self.assertEqual(root.children[4].amafVisits, 0)
+        self.assertEqual(mirrored.children[2].amafVisits, 1)
+        self.assertEqual(mirrored.children[4].amafVisits, 0)
+
+
+
+class EvictionTest(SettingsTestCase):
+
+    def grownTree(self, shareNodes):
+        MCTS.TRANSPOSITIONS = shareNodes
+        random.seed(6)
+        root = MCTS.Node(game1.newGame(True), None, {} if shareNodes else None)
+        MCTS.search(root, 3000)
+        return root
+
+    def checkEviction(self, shareNodes):
+        root = self.grownTree(shareNodes)
+        size = len(MCTS.treeNodes(root))
+        target = size // 2
+        evicted = MCTS.evictNodes(root, target)
+        nodes = MCTS.treeNodes(root)
+        self.assertEqual(len(nodes), size - evicted)
+        self.assertTrue(len(nodes) <= target)
+        kept = set(id(node) for node in nodes)
+        for node in nodes[1:]:
+            self.assertTrue(id(node.parent) in kept)
+            self.assertTrue(node in node.parent.children.values())
+        if shareNodes:
+            self.assertEqual(len(root.table), len(nodes))
+
+    def testEvictTree(self):
+        self.checkEviction(False)
+
+    def testEvictWithTranspositions(self):
+        self.checkEviction(True)
+
+    def testSearchStaysWithinBudget(self):
+        for shareNodes in (False, True):
+            MCTS.MAX_NODES = 500
+            root = self.grownTree(shareNodes)
+            self.assertTrue(len(MCTS.treeNodes(root)) <= MCTS.MAX_NODES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+"""
+test_pacman.py
+Checks of the Pacman game state in game.py, pacman.py and layout.py. Run with
+    python -m unittest discover -p "test_*.py"
+"""
+
+import os
+import random
+import subprocess
+import sys
+import unittest
+
+import layout
+import pacman
+from game import Actions, Directions
+
+
+def newState(layoutName="smallClassic"):
+    """
+    Returns the starting GameState of the named layout.
+    """
+    state = pacman.GameState()
+    state.initialize(layout.getLayout(layoutName), 2)
+    return state
+
+def randomStates(numMoves, seed, layoutName="smallClassic"):
+    """
+    Yields the states of a game in which every agent moves at random.
+    """
+    rng = random.Random(seed)
+    state = newState(layoutName)
+    agent = 0
+    for i in range(numMoves):
+        yield state
+        if state.isWin() or state.isLose():
+            return
+        state = state.generateSuccessor(agent, rng.choice(state.getLegalActions(agent)))
+        agent = (agent + 1) % state.getNumAgents()
+
+
+class AgentStateTest(unittest.TestCase):
+
+    def testAgentStatesAreImmutable(self):
+        agentState = newState().getPacmanState()
+        self.assertRaises(AttributeError, setattr, agentState, "scaredTimer", 5)
+        self.assertTrue(agentState.copy() is agentState)
+
+    def testSuccessorsLeaveTheirParentAlone(self):
+        for state in randomStates(200, 1):
+            if state.isWin() or state.isLose():
+                continue
+            before = [(s.configuration, s.scaredTimer) for s in state.data.agentStates]
+            food = state.getFood().copy()
+            for action in state.getLegalActions(0):
+                state.generateSuccessor(0, action)
+            self.assertEqual([(s.configuration, s.scaredTimer) for s in state.data.agentStates],
+                             before)
+            self.assertEqual(state.getFood(), food)
+
+    def testEqualStatesHashEqually(self):
+        for state in randomStates(100, 2):
+            if state.isWin() or state.isLose():
+                continue
+            action = state.getLegalActions(0)[0]
+            a = state.generateSuccessor(0, action)
+            b = state.generateSuccessor(0, action)
+            self.assertEqual(a, b)
+            self.assertEqual(hash(a), hash(b))
+
+
+
+def referenceGhostActions(config, walls):
+    """
+    A ghost's legal actions worked out directly from the walls, as the rules
+    did before Layout's action tables.
+    """
+    possible = Actions.getPossibleActions(config, walls)
+    if Directions.STOP in possible:
+        possible.remove(Directions.STOP)
+    reverse = Actions.reverseDirection(config.direction)
+    if reverse in possible and len(possible) > 1:
+        possible.remove(reverse)
+    return possible
+
+
+class ActionTableTest(unittest.TestCase):
+
+    def checkActions(self, state):
+        walls = state.getWalls()
+        pacmanConfig = state.getPacmanState().configuration
+        self.assertEqual(sorted(state.getLegalActions(0)),
+                         sorted(Actions.getPossibleActions(pacmanConfig, walls)))
+        for agent in range(1, state.getNumAgents()):
+            config = state.getGhostState(agent).configuration
+            self.assertEqual(sorted(state.getLegalActions(agent)),
+                             sorted(referenceGhostActions(config, walls)))
+
+    def testTablesMatchTheWalls(self):
+        for layoutName in ("smallClassic", "mediumClassic", "trappedClassic"):
+            for seed in range(5):
+                for state in randomStates(300, seed, layoutName):
+                    if not (state.isWin() or state.isLose()):
+                        self.checkActions(state)
+
+    def testCallersGetTheirOwnLists(self):
+        state = newState()
+        state.getLegalActions(0).append("Nowhere")
+        state.getLegalActions(1).append("Nowhere")
+        self.assertFalse("Nowhere" in state.getLegalActions(0))
+        self.assertFalse("Nowhere" in state.getLegalActions(1))
+
+
+
+def referenceDistances(walls, start):
+    """
+    Maze distances from start to every reachable cell, by breadth-first search.
+    """
+    distances = {start: 0}
+    frontier = [start]
+    for pos in frontier:
+        for neighbor in Actions.getLegalNeighbors(pos, walls):
+            if neighbor not in distances:
+                distances[neighbor] = distances[pos] + 1
+                frontier.append(neighbor)
+    return distances
+
+
+class MazeDistanceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.layout = layout.getLayout("mediumClassic")
+        walls = self.layout.walls
+        self.cells = [(x, y) for x in range(walls.width) for y in range(walls.height)
+                      if not walls[x][y]]
+
+    def testMatchesBreadthFirstSearch(self):
+        rng = random.Random(7)
+        for start in rng.sample(self.cells, 10):
+            distances = referenceDistances(self.layout.walls, start)
+            for end in rng.sample(self.cells, 20):
+                self.assertEqual(self.layout.mazeDistance(start, end), distances[end])
+
+    def testPositionsBetweenCells(self):
+        walls = self.layout.walls
+        end = self.cells[0]
+        distances = referenceDistances(walls, end)
+        for x, y in self.cells:
+            if (x + 1, y) in distances:
+                self.assertEqual(self.layout.mazeDistance((x + .5, y), end),
+                                 .5 + min(distances[(x, y)], distances[(x + 1, y)]))
+
+    def testPositionsInsideWallsUseManhattanDistance(self):
+        self.assertEqual(self.layout.mazeDistance((0, 0), (3, 4)), 7)
+
+
+class AutograderTest(unittest.TestCase):
+
+    def testAutograderPasses(self):
+        directory = os.path.dirname(os.path.abspath(__file__))
+        output = subprocess.Popen([sys.executable, "autograder.py", "--no-graphics"],
+                                  cwd=directory, stdout=subprocess.PIPE).communicate()[0]
+        self.assertTrue("Total: 9/9" in output, output[-2000:])
+
+
+if __name__ == "__main__":
+    unittest.main()
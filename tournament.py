@@ -0,0 +1,209 @@
+"""
+tournament.py
+Runs many MCTS games in parallel over a grid of settings, for example
+
+    python tournament.py --ucbConst .1 .5 1 --rollouts 20 75 --positions first second \
+        --numGames 100 --workers 8 --out sweep.csv
+
+plays 100 games for each of the 3 x 2 x 2 combinations of UCB constant,
+rollouts and whether MCTS moves first, spread over 8 processes. Each game
+gets its own deterministic seed, so any single game can be replayed. Results
+are written to the output file (CSV, or JSON lines if its name ends in
+.jsonl) as games finish, and a summary of MCTS win rates with 95% confidence
+intervals is printed at the end. With --statsFile, the statistics of every
+MCTS search (see MCTS.searchRecord) are also written there as JSON lines,
+tagged with the configuration, game and seed they came from.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import random
+import time
+from math import sqrt
+
+import MCTS
+import game1
+
+FIELDS = ["config", "ucbConst", "rollouts", "opponentRollouts", "position", "game",
+          "seed", "winner", "mctsResult", "rollouts/s", "seconds"]
+
+def makeConfigs(args):
+    """
+    Returns a list with one dictionary of settings per point of the grid.
+    """
+    configs = []
+    grid = itertools.product(args.ucbConst, args.rollouts, args.opponentRollouts, args.positions)
+    for i, (ucbConst, rollouts, opponentRollouts, position) in enumerate(grid):
+        configs.append({"config": i, "ucbConst": ucbConst, "rollouts": rollouts,
+                        "opponentRollouts": opponentRollouts, "position": position})
+    return configs
+
+def makeJobs(configs, numGames, baseSeed, boardArgs, logSearches=False):
+    """
+    Returns one (config, game number, seed, board arguments, logSearches) job
+    per game, where the board arguments are a dictionary of the bitboard,
+    height, width and connect settings. Seeds depend only on baseSeed and the
+    game's place in the grid.
+    """
+    jobs = []
+    for config in configs:
+        for game in range(numGames):
+            seed = baseSeed + config["config"] * numGames + game
+            jobs.append((config, game, seed, boardArgs, logSearches))
+    return jobs
+
+def playJob(job):
+    """
+    Plays one game of a tournament (in a worker process) and returns its row
+    of results, along with the statistics of its searches if logSearches is set.
+    """
+    config, game, seed, boardArgs, logSearches = job
+    random.seed(seed)
+    MCTS.UCB_CONST = config["ucbConst"]
+    MCTS.SEARCH_LOG = [] if logSearches else None
+    second = config["position"] == "second"
+    gameArgs = argparse.Namespace(rollouts=config["rollouts"], second=second,
+                                  rolloutsSecondMCTSAgent=config["opponentRollouts"],
+                                  **boardArgs)
+    stats = {}
+    start = time.time()
+    node = MCTS.playGame(gameArgs, stats)
+    winner = node.state.value()
+    row = dict(config)
+    row["game"] = game
+    row["seed"] = seed
+    row["winner"] = winner
+    # +1 if the MCTS agent won, 0 for a draw, -1 if it lost
+    row["mctsResult"] = -winner if second else winner
+    row["rollouts/s"] = round(stats["rollouts"] / stats["searchTime"]) if stats.get("searchTime") else 0
+    row["seconds"] = round(time.time() - start, 3)
+    searches = MCTS.SEARCH_LOG or []
+    for record in searches:
+        record.update(config)
+        record["game"] = game
+        record["seed"] = seed
+    return row, searches
+
+def wilsonInterval(wins, games, z=1.96):
+    """
+    The Wilson score confidence interval for a win rate of wins out of games.
+    """
+    if games == 0:
+        return 0., 1.
+    p = float(wins) / games
+    center = (p + z * z / (2 * games)) / (1 + z * z / games)
+    spread = z * sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+    return center - spread, center + spread
+
+class ResultWriter(object):
+    """
+    Appends result rows to a CSV file, or a JSON lines file if the name ends
+    in .jsonl, flushing after every row.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "w")
+        self.jsonLines = path.endswith(".jsonl")
+        if not self.jsonLines:
+            self.writer = csv.DictWriter(self.file, FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.jsonLines:
+            self.file.write(json.dumps(row, sort_keys=True) + "\n")
+        else:
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def printSummary(configs, results):
+    """
+    Prints the MCTS agent's wins, draws and win rate (counting draws as half a
+    win) with a 95% confidence interval for every configuration.
+    """
+    print "config ucbConst rollouts opponent position games wins draws winRate 95%CI"
+    for config in configs:
+        rows = results[config["config"]]
+        wins = sum(1 for row in rows if row["mctsResult"] == 1)
+        draws = sum(1 for row in rows if row["mctsResult"] == 0)
+        score = wins + .5 * draws
+        low, high = wilsonInterval(score, len(rows))
+        rate = score / len(rows) if rows else 0.
+        print "%6d %8g %8d %8d %8s %5d %4d %5d %7.3f [%.3f, %.3f]" % (
+            config["config"], config["ucbConst"], config["rollouts"], config["opponentRollouts"],
+            config["position"], len(rows), wins, draws, rate, low, high)
+
+def parse_args():
+    """
+    Parse command line arguments.
+    """
+    p = argparse.ArgumentParser()
+    p.add_argument("--ucbConst", type=float, nargs="+", default=[.5], help="UCB exploration "+\
+                    "constants to sweep. Default=.5")
+    p.add_argument("--rollouts", type=int, nargs="+", default=[75], help="MCTS rollouts "+\
+                    "to sweep. Default=75")
+    p.add_argument("--opponentRollouts", type=int, nargs="+", default=[0], help="Rollouts "+\
+                    "of the opponent MCTS agent to sweep; 0 is a random opponent. Default=0")
+    p.add_argument("--positions", nargs="+", choices=["first", "second"], default=["first"],
+                    help="Whether the MCTS agent moves first, second or both. Default=first")
+    p.add_argument("--numGames", type=int, default=100, help="Games per configuration. "+\
+                    "Default=100")
+    p.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="Number "+\
+                    "of processes to play games in. Default=number of CPUs")
+    p.add_argument("--seed", type=int, default=0, help="Base random seed. Default=0")
+    p.add_argument("--bitboard", action="store_true", help="Set this flag to "+\
+                    "use the bitboard representation of the board.")
+    p.add_argument("--height", type=int, default=game1.HEIGHT, help="Number of rows "+\
+                    "on the board. Default=" + str(game1.HEIGHT))
+    p.add_argument("--width", type=int, default=game1.WIDTH, help="Number of columns "+\
+                    "on the board. Default=" + str(game1.WIDTH))
+    p.add_argument("--connect", type=int, default=game1.CONNECT, help="Number of pieces "+\
+                    "in a row needed to win. Default=" + str(game1.CONNECT))
+    p.add_argument("--out", default="tournament.csv", help="File to stream results to; "+\
+                    "JSON lines if it ends in .jsonl. Default=tournament.csv")
+    p.add_argument("--statsFile", help="File to stream the statistics of every MCTS "+\
+                    "search to, as JSON lines.")
+    args = p.parse_args()
+    try:
+        game1.getGeometry(args.height, args.width, args.connect)
+    except ValueError as e:
+        p.error(str(e))
+    return args
+
+def main():
+    """
+    Runs the tournament described by the command line arguments.
+    """
+    args = parse_args()
+    configs = makeConfigs(args)
+    boardArgs = {"bitboard": args.bitboard, "height": args.height, "width": args.width,
+                 "connect": args.connect}
+    jobs = makeJobs(configs, args.numGames, args.seed, boardArgs, bool(args.statsFile))
+    results = dict((config["config"], []) for config in configs)
+    writer = ResultWriter(args.out)
+    statsFile = open(args.statsFile, "w") if args.statsFile else None
+    pool = multiprocessing.Pool(args.workers)
+    try:
+        for i, (row, searches) in enumerate(pool.imap_unordered(playJob, jobs)):
+            writer.write(row)
+            results[row["config"]].append(row)
+            if statsFile is not None:
+                for record in searches:
+                    statsFile.write(json.dumps(record, sort_keys=True) + "\n")
+                statsFile.flush()
+            print "Finished game %d/%d" % (i + 1, len(jobs))
+    finally:
+        pool.close()
+        pool.join()
+        writer.close()
+        if statsFile is not None:
+            statsFile.close()
+    printSummary(configs, results)
+
+if __name__ == "__main__":
+    main()